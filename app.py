@@ -3,17 +3,45 @@ import streamlit as st
 from datetime import datetime
 import json
 import os
+import pandas as pd
 from dotenv import load_dotenv
-import firebase_admin
-from firebase_admin import auth
 from firebase_admin.exceptions import FirebaseError
 import google.generativeai as genai
 
 # Load environment variables
 load_dotenv()
 
-# Import our centralized DB helper
-from utils.db import get_db, initialize_firebase
+# Import our centralized storage helper
+from utils.storage import get_storage, get_backend_name, AccountExistsError, AccountNotFoundError
+from utils.chat_store import to_chat_history
+from utils.session_memory import (new_chat_history, remember_plan, resolve_plan,
+                                  record_session_usage, top_sessions)
+from utils.auth import is_admin
+from utils.render import sanitize_plan_html, get_rendered_plan
+from utils.coordination import cached_generate, get_coordinator
+from utils.router import get_router
+from utils.usage import check_quota, track_usage
+from utils.knowledge import search as search_knowledge, format_for_prompt
+from utils.analytics import ANALYTICS_DAYS
+from utils.async_store import load_session_data
+from utils.profiling import (PROFILE_OVERLAY, stage, profile_rerun, current_rerun, recent_reruns,
+                             slowest_stages, recent_profiles, export_histograms_csv, export_histograms_json)
+
+# Number of past chat turns restored into the AI Coach tab at login
+CHAT_HISTORY_LOAD_TURNS = 50
+# Plan metadata entries per Plan History page (the first page is fetched at login)
+PLAN_HISTORY_PAGE_SIZE = 20
+# Lifetime of shared cached generations (seconds); identical requests within it reuse the answer
+PLAN_CACHE_TTL = int(os.getenv("PLAN_CACHE_TTL", "86400"))
+CHAT_CACHE_TTL = int(os.getenv("CHAT_CACHE_TTL", "600"))
+# Admin dashboard aggregates are shared by all sessions and recomputed at most this often (seconds)
+ANALYTICS_CACHE_TTL = int(os.getenv("ANALYTICS_CACHE_TTL", "600"))
+
+@st.cache_data(ttl=ANALYTICS_CACHE_TTL, show_spinner="Loading analytics...")
+def load_analytics(backend_name, days):
+    """Dashboard aggregates, cached per backend so admin reruns don't repeat the queries."""
+    store = get_storage()
+    return store.analytics(days) if store else None
 
 # Configure Gemini if provided
 def initialize_gemini():
@@ -23,30 +51,26 @@ def initialize_gemini():
             st.warning("GEMINI_API_KEY not set. AI features will be disabled.")
             return None
         genai.configure(api_key=api_key)
-        # Using Gemini 1.5 Flash model
-        return genai.GenerativeModel('gemini-1.5-flash')
+        # Each request is routed to a model tier by task, prompt size and recent latency;
+        # the router is shared by the whole process so those observations outlive a rerun
+        return get_router()
     except Exception as e:
         st.error(f"Gemini initialization failed: {e}")
         return None
 
-# Firebase authentication functions
-def firebase_register(email, password, user_data):
+# Account functions
+def register_account(store, email, password, user_data):
     try:
-        db = get_db()
-        if db is None:
-            st.error("Firebase Admin SDK is not initialized. Can't create user.")
+        if store is None:
+            st.error("Storage is not initialized. Can't create user.")
             return None
 
-        user = auth.create_user(
-            email=email,
-            password=password,
-            display_name=user_data.get('name', 'Athlete')
-        )
+        user_id = store.create_account(email, password, user_data.get('name', 'Athlete'))
 
         user_data.setdefault('name', 'Athlete')
         user_data.setdefault('created_at', datetime.now().isoformat())
-        return user.uid
-    except auth.EmailAlreadyExistsError:
+        return user_id
+    except AccountExistsError:
         st.error("⚠️ Email already registered. Please login instead.")
     except ValueError as e:
         st.error(f"❌ Invalid data: {str(e)}")
@@ -56,16 +80,14 @@ def firebase_register(email, password, user_data):
         st.error(f"🚨 Registration failed: {str(e)}")
     return None
 
-def firebase_get_user_by_email(email):
+def authenticate_account(store, email, password):
     try:
-        db = get_db()
-        if db is None:
-            st.error("Firebase Admin SDK is not initialized. Can't look up user.")
+        if store is None:
+            st.error("Storage is not initialized. Can't look up user.")
             return None
-        user = auth.get_user_by_email(email)
-        return user.uid
-    except auth.UserNotFoundError:
-        st.error("🔍 User not found. Please register first.")
+        return store.authenticate(email, password)
+    except AccountNotFoundError:
+        st.error("🔍 User not found or wrong password. Please register first.")
     except FirebaseError as e:
         st.error(f"🔥 Firebase error: {e.code} - {e.message}")
     except Exception as e:
@@ -73,7 +95,8 @@ def firebase_get_user_by_email(email):
     return None
 
 # Enhanced AI helper with detailed technical focus
-def generate_training_plan(model, user_profile, duration=4):
+@stage("app.generate_training_plan")
+def generate_training_plan(model, user_profile, duration=4, refresh=False):
     try:
         if not model:
             raise ValueError("AI model not initialized")
@@ -89,11 +112,15 @@ def generate_training_plan(model, user_profile, duration=4):
         performance_goal = user_profile.get('performance_goal', '')
         motivational_style = user_profile.get('motivational_style', 'technical')
         plan_length = user_profile.get('plan_length', 'medium')
+        references = format_for_prompt(
+            search_knowledge(f"{goals} {performance_goal} technique drill mistake", sport=sport, k=6)
+        )
 
-        prompt = f"""
-Create a comprehensive {duration}-week {sport} training plan for a {experience} athlete with these goals: {goals}.
+        # Stable prefix (format spec + athlete profile) is context-cached; only the request varies per call
+        prefix = f"""
+You are an elite {sport} performance coach writing training plans for a {experience} athlete with these goals: {goals}.
 
-Structure the response EXACTLY as follows:
+Structure every plan EXACTLY as follows, where [N] is the requested number of weeks:
 
 <plan>
 <div class='coaching-plan'>
@@ -109,7 +136,7 @@ Structure the response EXACTLY as follows:
 </div>
 
 <div class='weekly-plan'>
-<h4>{duration}-Week Training Structure</h4>
+<h4>[N]-Week Training Structure</h4>
 [For each week block]
 <div class='week-section'>
 <h5>Week [X]: [Phase Name]</h5>
@@ -125,10 +152,10 @@ Structure the response EXACTLY as follows:
 
 <div class='technical-section'>
 <h4>Technical Excellence</h4>
-<p><strong>Key Drill:</strong> [Specific drill with step-by-step instructions]</p>
-<p><strong>Game-Specific Techniques:</strong> [5-6 sport-specific technical tips for in-game situations]</p>
+<p><strong>Key Drill:</strong> [Name a reference drill and when to use it in the plan]</p>
+<p><strong>Game-Specific Techniques:</strong> [Reference cues by name, one line each]</p>
 <p><strong>Tactical Insights:</strong> [Positioning strategies and decision-making guidance]</p>
-<p><strong>Common Mistakes:</strong> [Frequent errors and how to correct them]</p>
+<p><strong>Common Mistakes:</strong> [Reference mistakes by name with a one-line fix]</p>
 <p><strong>Equipment Optimization:</strong> [Specific guidance on gear selection and usage]</p>
 </div>
 
@@ -159,44 +186,52 @@ Include:
 - Equipment optimization tips
 
 For the Technical Excellence section:
-- Provide 3-5 specific game techniques relevant to {sport}
+- Use the reference library below for drills, cues and mistakes; cite entries by name and do not re-explain them
 - Include tactical positioning advice for different game situations
-- List common mistakes and their corrections
 - Add sport-specific equipment tips
 
+Reference Library:
+{references}
+
 Athlete Details:
 - Available Days: {available_days}/week
 - Equipment: {equipment_str}
 - Injuries/Limitations: {injuries}
 - Performance Goal: {performance_goal}
 """
+        prompt = f"Create a comprehensive {duration}-week {sport} training plan (N = {duration})."
         
-        response = model.generate_content(prompt)
-        if not response or not getattr(response, "text", None):
+        response_text = cached_generate(model, prompt, ttl=PLAN_CACHE_TTL, refresh=refresh, task="plan",
+                                        plan_length=plan_length, duration=duration,
+                                        prefix=prefix, cache_owner=f"{st.session_state.user}:plan")
+        if not response_text:
             return None
             
         # Extract the plan content
-        response_text = response.text.strip()
+        response_text = response_text.strip()
         
         # Find the plan content between <plan> tags
         start = response_text.find('<plan>') + len('<plan>')
         end = response_text.find('</plan>')
         
         if start != -1 and end != -1:
-            return response_text[start:end].strip()
-        return response_text
+            response_text = response_text[start:end].strip()
+        # Sanitize once here so stored, displayed and downloaded plans never carry unsafe markup
+        return sanitize_plan_html(response_text)
         
     except Exception as e:
         st.error(f"AI error: {e}")
         return None
 
+@stage("app.chat_with_coach")
 def chat_with_coach(model, user_profile, chat_history, message):
     try:
         if not model:
             raise ValueError("AI model not initialized")
         
-        # Enhanced context with technical coaching requirements
-        context = (
+        # Enhanced context with technical coaching requirements; persona and profile form a
+        # stable, context-cached prefix and only the per-turn context is sent each time
+        prefix = (
             f"You're a professional {user_profile.get('sport', 'fitness')} coach with expertise in biomechanics and "
             f"performance optimization. Provide detailed technical advice including:\n"
             f"- Sport-specific technique breakdowns\n"
@@ -204,37 +239,109 @@ def chat_with_coach(model, user_profile, chat_history, message):
             f"- Periodization strategies\n"
             f"- Equipment optimization tips\n"
             f"- Scientific references when appropriate\n\n"
-            f"Athlete Profile:\n{json.dumps(user_profile, indent=2)}\n\n"
-            f"Conversation History:\n{json.dumps(chat_history[-3:], indent=2) if chat_history else 'None'}"
+            f"Athlete Profile:\n{json.dumps(user_profile, indent=2, sort_keys=True)}"
+        )
+        context = (
+            f"Reference drills, cues and mistakes (cite by name rather than re-explaining):\n"
+            f"{format_for_prompt(search_knowledge(message, sport=user_profile.get('sport'), k=3))}\n\n"
+            f"Conversation History:\n{json.dumps(list(chat_history)[-3:], indent=2) if chat_history else 'None'}"
         )
         
-        response = model.generate_content([context, message])
-        return response.text if response and getattr(response, "text", None) else "AI error"
+        response_text = cached_generate(model, [context, message], ttl=CHAT_CACHE_TTL, task="chat",
+                                        prefix=prefix, cache_owner=f"{st.session_state.user}:chat")
+        return response_text or "AI error"
     except Exception as e:
         st.error(f"AI error: {e}")
         return "I'm having trouble responding right now. Please try again later."
 
+def quota_message(store, kind):
+    # Friendly throttling message when the user is over quota. Storage errors let the request
+    # through; they are logged for operators rather than shown to the athlete on every turn
+    try:
+        return check_quota(store, st.session_state.user, kind)
+    except Exception as e:
+        print(f"Usage quota check failed for {kind} request, allowing it: {e}")
+        return None
+
+def plan_title():
+    return f"{st.session_state.profile.get('sport', 'General Fitness')} Training Plan"
+
+@stage("app.render_plan")
+def render_plan(rendered):
+    # Shared display path: pre-sanitized HTML plus ready-built download bytes
+    st.markdown(rendered.html, unsafe_allow_html=True)
+    st.download_button(
+        "📥 Download Plan",
+        data=rendered.download,
+        file_name=f"{st.session_state.profile['sport']}_training_plan.html",
+        mime="text/html"
+    )
+
+@stage("app.save_generated_plan")
+def save_generated_plan(store, plan_html, duration, focus, chat_turn=None):
+    # Persist the plan (when storage is available) and keep one in-session copy, referenced by hash.
+    # chat_turn=(message, response, sport) is written in the same batch as the plan it refers to.
+    plan_ref = None
+    if store:
+        with store.batch():
+            saved = store.save_plan(st.session_state.user, plan_html, duration, focus)
+            if chat_turn:
+                message, response, sport = chat_turn
+                store.append_chat_turn(st.session_state.user, message, response, sport=sport,
+                                       plan_ref=saved['body_hash'])
+        # Until the first page is loaded, the history tab fetches it (including this plan) itself
+        if st.session_state.plan_history or st.session_state.plan_history_done:
+            st.session_state.plan_history.insert(0, saved)
+        plan_ref = saved['body_hash']
+    return remember_plan(st.session_state, plan_html, plan_ref)
+
+def render_chat_message(message, store):
+    with st.chat_message("user" if message["role"] == "user" else "assistant"):
+        st.markdown(message["content"])
+        plan_ref = message.get("plan_ref")
+        if plan_ref:
+            rendered = get_rendered_plan(plan_ref, lambda: resolve_plan(st.session_state, plan_ref, store), plan_title())
+            if rendered:
+                st.markdown(rendered.html, unsafe_allow_html=True)
+
+@stage("app.load_more_plan_history")
+def load_more_plan_history(store):
+    items, cursor = store.list_plans(st.session_state.user, page_size=PLAN_HISTORY_PAGE_SIZE,
+                                     start_after=st.session_state.plan_history_cursor)
+    known = {plan['id'] for plan in st.session_state.plan_history}
+    st.session_state.plan_history.extend(plan for plan in items if plan['id'] not in known)
+    st.session_state.plan_history_cursor = cursor
+    st.session_state.plan_history_done = cursor is None
+
 # Main application
 def main():
     st.set_page_config(page_title="MiniGPT Coach", page_icon="🏋️", layout="wide")
     st.title("🏋️ MiniGPT Coach")
 
-    # Initialize Firebase
-    db = get_db()
-    if db is None:
+    # Initialize storage
+    with stage("app.init_storage"):
+        store = get_storage()
+    if store is None:
         st.warning(
-            "Firestore is not initialized. Database features (register/login/save profile, store plans/chats) "
-            "will be disabled until you provide a valid service account JSON and set FIREBASE_CONFIG_PATH.\n\n"
-            "Place `firebase_config.json` in project root OR set env var FIREBASE_CONFIG_PATH to its path."
+            f"Storage backend '{get_backend_name()}' is not initialized. Database features "
+            "(register/login/save profile, store plans/chats) will be disabled.\n\n"
+            "For Firestore, place `firebase_config.json` in project root OR set env var FIREBASE_CONFIG_PATH "
+            "to its path. To run without Firebase, set STORAGE_BACKEND=sqlite."
         )
 
-    gemini_model = initialize_gemini()
+    with stage("app.init_model"):
+        gemini_model = initialize_gemini()
 
     # Initialize session state
     st.session_state.setdefault('user', None)
     st.session_state.setdefault('profile', None)
-    st.session_state.setdefault('chat_history', [])
+    st.session_state.setdefault('chat_history', new_chat_history())
     st.session_state.setdefault('generated_plan', None)
+    st.session_state.setdefault('plan_history', [])
+    st.session_state.setdefault('plan_history_cursor', None)
+    st.session_state.setdefault('plan_history_done', False)
+    # Account this session's memory once per rerun for the admin view
+    record_session_usage(st.session_state, st.session_state.user)
 
     # Authentication section
     if not st.session_state.user:
@@ -247,18 +354,32 @@ def main():
 
             if st.button("Sign In", key="login_btn"):
                 if email and password:
-                    if db is None:
+                    if store is None:
                         st.error("Database not initialized. Can't authenticate.")
                     else:
                         with st.spinner("Authenticating..."):
-                            user_id = firebase_get_user_by_email(email)
+                            user_id = authenticate_account(store, email, password)
                             if user_id:
+                                # Profile, chat and plan history are independent reads; fetch them concurrently
                                 try:
-                                    doc = db.collection('users').document(user_id).get()
-                                    profile = doc.to_dict() if doc.exists else {'name': 'Athlete'}
+                                    loaded = load_session_data(store, user_id, chat_limit=CHAT_HISTORY_LOAD_TURNS,
+                                                               plan_page_size=PLAN_HISTORY_PAGE_SIZE)
                                 except Exception as e:
-                                    st.error(f"Failed to load profile: {e}")
-                                    profile = {'name': 'Athlete'}
+                                    loaded = {"profile": e, "turns": e, "plans": e}
+                                profile = loaded["profile"]
+                                if isinstance(profile, Exception):
+                                    st.error(f"Failed to load profile: {profile}")
+                                    profile = None
+                                profile = profile or {'name': 'Athlete'}
+                                if isinstance(loaded["turns"], Exception):
+                                    st.warning(f"Failed to load chat history: {loaded['turns']}")
+                                else:
+                                    st.session_state.chat_history = new_chat_history(to_chat_history(loaded["turns"]))
+                                if not isinstance(loaded["plans"], Exception):
+                                    items, cursor = loaded["plans"]
+                                    st.session_state.plan_history = items
+                                    st.session_state.plan_history_cursor = cursor
+                                    st.session_state.plan_history_done = cursor is None
                                 st.session_state.user = user_id
                                 st.session_state.profile = profile
                                 st.rerun()
@@ -288,17 +409,20 @@ def main():
                 elif password != confirm:
                     st.error("Passwords don't match!")
                 else:
-                    if db is None:
+                    if store is None:
                         st.error("Database not initialized. Can't create account.")
                     else:
                         with st.spinner("Creating your account..."):
                             user_data = {"name": name, "sport": sport, "created_at": datetime.now().isoformat()}
-                            user_id = firebase_register(email, password, user_data)
+                            user_id = register_account(store, email, password, user_data)
                             if user_id:
                                 try:
-                                    db.collection('users').document(user_id).set(user_data)
+                                    store.set_user(user_id, user_data, merge=False)
                                     st.session_state.user = user_id
                                     st.session_state.profile = user_data
+                                    # A new account has no saved plans to page through
+                                    st.session_state.plan_history = []
+                                    st.session_state.plan_history_done = True
                                     st.success("Account created successfully!")
                                     st.rerun()
                                 except Exception as e:
@@ -313,7 +437,10 @@ def main():
                 st.session_state.clear()
                 st.rerun()
             st.divider()
-            app_mode = st.radio("Menu", ["📝 Profile", "📅 Training Plan", "💬 AI Coach"], index=1, label_visibility="collapsed")
+            menu = ["📝 Profile", "📅 Training Plan", "🗂️ Plan History", "💬 AI Coach"]
+            if is_admin(st.session_state.user):
+                menu.append("🛠️ Admin")
+            app_mode = st.radio("Menu", menu, index=1, label_visibility="collapsed")
 
         if app_mode == "📝 Profile":
             st.header("Your Profile")
@@ -376,11 +503,11 @@ def main():
                         "motivational_style": motivational_style, "plan_length": plan_length,
                         "last_updated": datetime.now().isoformat()
                     }
-                    if db is None:
+                    if store is None:
                         st.error("Database not initialized. Can't save profile.")
                     else:
                         try:
-                            db.collection('users').document(st.session_state.user).set(updated_profile, merge=True)
+                            store.set_user(st.session_state.user, updated_profile, merge=True)
                             st.session_state.profile = updated_profile
                             st.success("Profile saved successfully!")
                         except Exception as e:
@@ -401,49 +528,98 @@ def main():
                                                          "Muscle Gain", "Skill Development"])
             
             if st.button("✨ Generate New Plan"):
-                with st.spinner("Creating your personalized plan..."):
-                    plan_html = generate_training_plan(gemini_model, st.session_state.profile, duration)
-                    if plan_html:
-                        try:
-                            st.session_state.generated_plan = plan_html
-                            if db:
-                                db.collection('plans').document(st.session_state.user).collection('training_plans').add({
-                                    "plan": plan_html,
-                                    "created_at": datetime.now().isoformat(),
-                                    "duration": duration,
-                                    "focus": focus
-                                })
-                            st.success("Plan generated successfully!")
-                        except Exception as e:
-                            st.error(f"Failed to save plan: {e}")
+                throttled = quota_message(store, "plan")
+                if throttled:
+                    st.warning(throttled)
+                else:
+                    with st.spinner("Creating your personalized plan..."):
+                        with track_usage(store, st.session_state.user, "plan"):
+                            # An explicit "new plan" must not return the cached plan for the same profile
+                            plan_html = generate_training_plan(gemini_model, st.session_state.profile, duration,
+                                                               refresh=True)
+                        if plan_html:
+                            try:
+                                st.session_state.generated_plan = save_generated_plan(store, plan_html, duration, focus)
+                                st.success("Plan generated successfully!")
+                            except Exception as e:
+                                # Still show the plan that was just generated; it only lives in this session
+                                st.session_state.generated_plan = remember_plan(st.session_state, plan_html)
+                                st.error(f"Failed to save plan: {e}")
             
-            if st.session_state.generated_plan:
+            plan_ref = st.session_state.generated_plan
+            rendered = plan_ref and get_rendered_plan(
+                plan_ref, lambda: resolve_plan(st.session_state, plan_ref, store), plan_title()
+            )
+            if rendered:
                 st.subheader("Your Performance Plan")
                 st.markdown("---")
                 
-                # Display the generated HTML plan
-                st.markdown(st.session_state.generated_plan, unsafe_allow_html=True)
-                
-                # Add download option
-                st.download_button(
-                    "📥 Download Plan",
-                    data=st.session_state.generated_plan,
-                    file_name=f"{st.session_state.profile['sport']}_training_plan.html",
-                    mime="text/html"
+                # Display the generated HTML plan with its download option
+                render_plan(rendered)
+
+        elif app_mode == "🗂️ Plan History":
+            st.header("Plan History")
+            if store is None:
+                st.warning("Database not initialized. Plan history is unavailable.")
+                st.stop()
+
+            if not st.session_state.plan_history and not st.session_state.plan_history_done:
+                try:
+                    load_more_plan_history(store)
+                except Exception as e:
+                    st.error(f"Failed to load plan history: {e}")
+
+            history = st.session_state.plan_history
+            if not history:
+                st.info("No saved plans yet. Generate one in the '📅 Training Plan' tab.")
+            else:
+                selected = st.selectbox(
+                    "Saved plans",
+                    range(len(history)),
+                    format_func=lambda i: (
+                        f"{history[i].get('created_at', '')[:16].replace('T', ' ')} · "
+                        f"{history[i].get('duration', '?')} weeks · {history[i].get('focus', 'General')}"
+                    ),
                 )
+                if not st.session_state.plan_history_done and st.button("⬇️ Load older plans"):
+                    try:
+                        load_more_plan_history(store)
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"Failed to load plan history: {e}")
+
+                if st.button("📂 Open Plan"):
+                    st.session_state.history_open_plan = history[selected]['id']
+
+                opened = next((p for p in history if p['id'] == st.session_state.get('history_open_plan')), None)
+                if opened:
+                    # Bodies are content-addressed, so the render cache is keyed by hash;
+                    # legacy plans without one fall back to their document id
+                    body_hash = opened.get('body_hash')
+                    try:
+                        rendered = get_rendered_plan(
+                            body_hash or f"plan:{st.session_state.user}/{opened['id']}",
+                            lambda: (store.load_plan_body(body_hash) if body_hash
+                                     else store.load_plan_by_id(st.session_state.user, opened['id'])),
+                            plan_title()
+                        )
+                    except Exception as e:
+                        st.error(f"Failed to load plan: {e}")
+                        rendered = None
+                    if rendered:
+                        st.markdown("---")
+                        render_plan(rendered)
+                    else:
+                        st.warning("This plan could not be found.")
 
         elif app_mode == "💬 AI Coach":
             st.header("AI Coach Chat")
             st.caption("Ask about technique, periodization, biomechanics, or equipment optimization")
             
             # Display chat history
-            for message in st.session_state.chat_history:
-                if message["role"] == "user":
-                    with st.chat_message("user"):
-                        st.markdown(message["content"])
-                else:
-                    with st.chat_message("assistant"):
-                        st.markdown(message["content"])
+            with stage("app.render_chat_log"):
+                for message in st.session_state.chat_history:
+                    render_chat_message(message, store)
             
             # User input
             if prompt := st.chat_input("Ask your coach anything..."):
@@ -457,6 +633,7 @@ def main():
                 # Get AI response
                 with st.spinner("Analyzing your question..."):
                     # Handle greetings and common phrases conversationally
+                    plan_ref, turn_saved = None, False
                     prompt_lower = prompt.strip().lower()
                     if prompt_lower in ["hi", "hello", "hey"]:
                         response = "Hello! I'm your AI Coach. How can I assist you with your training today?"
@@ -464,41 +641,148 @@ def main():
                         response = "You're welcome! Always here to help with your athletic development."
                     elif "plan" in prompt_lower and ("training" in prompt_lower or "workout" in prompt_lower):
                         # Generate training plan through chat
-                        with st.spinner("Creating your personalized plan..."):
-                            plan_html = generate_training_plan(
-                                gemini_model,
-                                st.session_state.profile,
-                                st.session_state.profile.get('plan_duration', 4)
-                            )
-                            if plan_html:
-                                response = (
-                                    "Here's your personalized training plan:\n\n" +
-                                    plan_html +
-                                    "\n\nYou can also find this in the '📅 Training Plan' tab."
-                                )
-                                st.session_state.generated_plan = plan_html
-                            else:
-                                response = "I couldn't generate a plan right now. Please try again later."
+                        throttled = quota_message(store, "plan")
+                        if throttled:
+                            response = throttled
+                        else:
+                            with st.spinner("Creating your personalized plan..."):
+                                with track_usage(store, st.session_state.user, "plan"):
+                                    plan_html = generate_training_plan(
+                                        gemini_model,
+                                        st.session_state.profile,
+                                        st.session_state.profile.get('plan_duration', 4)
+                                    )
+                                if plan_html:
+                                    response = ("Here's your personalized training plan. "
+                                                "You can also find this in the '📅 Training Plan' tab.")
+                                    try:
+                                        plan_ref = save_generated_plan(
+                                            store, plan_html, st.session_state.profile.get('plan_duration', 4), "Chat",
+                                            chat_turn=(prompt, response, st.session_state.profile.get('sport'))
+                                        )
+                                        turn_saved = store is not None
+                                    except Exception as e:
+                                        st.warning(f"Failed to save plan: {e}")
+                                        plan_ref = remember_plan(st.session_state, plan_html)
+                                    st.session_state.generated_plan = plan_ref
+                                else:
+                                    response = "I couldn't generate a plan right now. Please try again later."
+                    elif throttled := quota_message(store, "chat"):
+                        response = throttled
                     else:
                         # Handle other technical questions
-                        response = chat_with_coach(gemini_model, st.session_state.profile, st.session_state.chat_history, prompt)
+                        with track_usage(store, st.session_state.user, "chat"):
+                            response = chat_with_coach(gemini_model, st.session_state.profile, st.session_state.chat_history, prompt)
                     
-                    # Store and display response
-                    st.session_state.chat_history.append({"role":"assistant","content":response})
-                    if db:
+                    # Store and display response; plan bodies are kept once and referenced by hash
+                    reply = {"role":"assistant","content":response}
+                    if plan_ref:
+                        reply["plan_ref"] = plan_ref
+                    st.session_state.chat_history.append(reply)
+                    if store and not turn_saved:
                         try:
-                            db.collection('chats').document(st.session_state.user).collection('messages').add({
-                                "message": prompt, 
-                                "response": response, 
-                                "timestamp": datetime.now().isoformat()
-                            })
+                            store.append_chat_turn(st.session_state.user, prompt, response,
+                                                   sport=st.session_state.profile.get('sport'), plan_ref=plan_ref)
                         except Exception as e:
                             st.warning(f"Failed to persist chat: {e}")
-                    with st.chat_message("assistant"):
-                        st.markdown(response)
-
-
-                
+                    render_chat_message(reply, store)
+
+        elif app_mode == "🛠️ Admin":
+            st.header("Admin")
+            st.subheader(f"Operations (last {ANALYTICS_DAYS} days)")
+            st.caption(f"Server-side aggregates, refreshed every {ANALYTICS_CACHE_TTL // 60} minutes")
+            if st.button("🔄 Refresh now", key="refresh_analytics"):
+                load_analytics.clear()
+            try:
+                stats = load_analytics(get_backend_name(), ANALYTICS_DAYS)
+            except Exception as e:
+                st.error(f"Failed to load analytics: {e}")
+                stats = None
+            if stats:
+                col1, col2, col3, col4 = st.columns(4)
+                col1.metric("Active Users", stats["active_users"], help=f"of {stats['total_users']} registered")
+                col2.metric("Plans", stats["plans"])
+                col3.metric("Avg Plan Duration",
+                            f"{stats['avg_plan_duration']:.1f} wk" if stats["avg_plan_duration"] else "–")
+                col4.metric("Chat Turns", stats["chats"])
+                st.markdown("**Plans per day**")
+                st.bar_chart(pd.DataFrame(stats["plans_per_day"]).set_index("day"))
+                if stats["chats_by_sport"]:
+                    st.markdown("**Chat volume by sport**")
+                    st.dataframe(pd.DataFrame(stats["chats_by_sport"]), use_container_width=True, hide_index=True)
+            else:
+                st.info("No analytics available.")
+
+            st.subheader("Session Memory")
+            st.caption("Estimated session_state size per session in this server process")
+            sessions = top_sessions(20)
+            if sessions:
+                df = pd.DataFrame(sessions)
+                df["MB"] = (df["bytes"] / (1024 * 1024)).round(2)
+                df["updated_at"] = pd.to_datetime(df["updated_at"], unit="s")
+                st.dataframe(df[["user", "MB", "chat_messages", "cached_plans", "largest_key", "updated_at"]],
+                             use_container_width=True)
+            else:
+                st.info("No session data recorded yet.")
+
+            st.subheader("Top Consumers")
+            st.caption("Lifetime AI usage per user, heaviest output-token consumers first")
+            try:
+                consumers = store.top_usage(20) if store else []
+            except Exception as e:
+                st.error(f"Failed to load usage: {e}")
+                consumers = []
+            if consumers:
+                df = pd.DataFrame(consumers)
+                df["seconds"] = df["seconds"].round(1)
+                st.dataframe(df[["uid", "requests", "input_tokens", "output_tokens", "seconds", "last_request_at"]],
+                             use_container_width=True)
+            else:
+                st.info("No usage recorded yet.")
+
+            st.subheader("Model Routing (last 24h)")
+            st.caption("Attempts per task and model tier, shared across server processes")
+            coordinator = get_coordinator()
+            routing = coordinator.routing_summary() if coordinator else []
+            if routing:
+                df = pd.DataFrame(routing)
+                df[["avg_latency", "max_latency"]] = df[["avg_latency", "max_latency"]].round(2)
+                df["avg_prompt_chars"] = df["avg_prompt_chars"].round(0)
+                st.dataframe(df, use_container_width=True)
+            else:
+                st.info("No routing decisions recorded yet.")
+
+def render_profiling_overlay():
+    # Developer overlay (PROFILE_OVERLAY=1): this rerun's stages, the slowest stages so far and histogram export
+    with st.sidebar.expander("⏱️ Profiling", expanded=False):
+        rerun = current_rerun()
+        if rerun and rerun.stages:
+            st.caption("This rerun" + (" (cProfile sampled)" if rerun.profiled else ""))
+            df = pd.DataFrame(rerun.stages, columns=["stage", "ms", "depth"]).sort_values("ms", ascending=False)
+            st.dataframe(df.head(10).round(1), use_container_width=True, hide_index=True)
+        reruns = recent_reruns()
+        if reruns:
+            st.caption("Recent rerun totals (ms)")
+            st.line_chart(pd.DataFrame({"ms": [r.total_ms for r in reruns]}))
+        slowest = slowest_stages(10)
+        if slowest:
+            st.caption("Slowest stages in this process (by p95)")
+            st.dataframe(pd.DataFrame(slowest).round(1), use_container_width=True, hide_index=True)
+            col1, col2 = st.columns(2)
+            col1.download_button("CSV", export_histograms_csv(), file_name="stage_histograms.csv", mime="text/csv")
+            col2.download_button("JSON", export_histograms_json(), file_name="stage_histograms.json",
+                                 mime="application/json")
+        profiles = recent_profiles()
+        if profiles:
+            st.caption(f"Latest cProfile sample ({profiles[-1]['total_ms']:.0f} ms)")
+            st.code(profiles[-1]["stats"], language="text")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with profile_rerun():
+        try:
+            with stage("app.main"):
+                main()
+        finally:
+            # st.stop() and st.rerun() end main() with an exception; the overlay still renders
+            if PROFILE_OVERLAY:
+                render_profiling_overlay()
\ No newline at end of file
@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("firebase_admin")
+
+from utils.async_store import gather_bounded, load_session_data
+
+
+def test_gather_bounded_returns_exceptions_in_order():
+    async def ok(value):
+        await asyncio.sleep(0.01)
+        return value
+
+    async def fail():
+        raise ValueError("read failed")
+
+    results = asyncio.run(gather_bounded(ok(1), fail(), ok(3), limit=2))
+
+    assert results[0] == 1 and results[2] == 3
+    assert isinstance(results[1], ValueError)
+
+
+def test_gather_bounded_caps_concurrency():
+    running, peak = 0, 0
+
+    async def read():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+
+    asyncio.run(gather_bounded(*(read() for _ in range(6)), limit=2))
+
+    assert peak == 2
+
+
+class SlowStore:
+    name = "sqlite"
+
+    def get_user(self, user_id):
+        time.sleep(0.2)
+        return {"sport": "Running"}
+
+    def load_recent_turns(self, user_id, limit=200):
+        time.sleep(0.2)
+        raise RuntimeError("chats unavailable")
+
+    def list_plans(self, user_id, page_size=20, start_after=None):
+        time.sleep(0.2)
+        return [], None
+
+
+def test_load_session_data_reads_concurrently_and_keeps_failures():
+    started = time.perf_counter()
+    data = load_session_data(SlowStore(), "u1")
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 0.5
+    assert data["profile"] == {"sport": "Running"}
+    assert isinstance(data["turns"], RuntimeError)
+    assert data["plans"] == ([], None)
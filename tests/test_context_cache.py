@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip("google.generativeai")
+
+from utils.context_cache import FakeCacheProvider, PrefixCache
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+@pytest.fixture
+def cache(calls):
+    provider = FakeCacheProvider(generate=lambda model_name, contents, **kwargs: calls.append(contents))
+    return PrefixCache(provider, ttl_seconds=600, min_tokens=0)
+
+
+def test_changed_prefix_replaces_owner_entry(cache):
+    cache.model_for("gemini-pro", "profile v1", owner="u1:chat")
+    cache.model_for("gemini-pro", "profile v2", owner="u1:chat")
+
+    assert cache.provider.stats["created"] == 2
+    assert cache.provider.stats["deleted"] == 1
+    assert list(cache.provider.entries.values()) == ["profile v2"]
+
+
+def test_prefix_still_used_by_another_owner_is_kept(cache):
+    cache.model_for("gemini-pro", "shared persona", owner="u1:plan")
+    cache.model_for("gemini-pro", "shared persona", owner="u2:plan")
+    cache.model_for("gemini-pro", "u1 persona", owner="u1:plan")
+
+    assert cache.provider.stats["deleted"] == 0
+    assert sorted(cache.provider.entries.values()) == ["shared persona", "u1 persona"]
+
+
+def test_cached_model_sends_prefix_once_per_entry(cache, calls):
+    model = cache.model_for("gemini-pro", "persona", owner="u1:chat")
+    model.generate_content("question")
+    cache.model_for("gemini-pro", "persona", owner="u1:chat").generate_content(["context", "next"])
+
+    assert cache.provider.stats["created"] == 1
+    assert cache.provider.stats["hits"] == 2
+    assert calls == [["persona", "question"], ["persona", "context", "next"]]
+
+
+def test_short_prefix_is_sent_inline():
+    cache = PrefixCache(FakeCacheProvider(), min_tokens=100)
+    assert cache.model_for("gemini-pro", "too short", owner="u1:chat") is None
+    assert cache.provider.stats["created"] == 0
+
+
+def test_invalidated_entry_is_registered_again(cache):
+    cache.model_for("gemini-pro", "persona")
+    cache.invalidate("gemini-pro", "persona")
+    cache.model_for("gemini-pro", "persona")
+
+    assert cache.provider.stats["created"] == 2
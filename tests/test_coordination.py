@@ -0,0 +1,79 @@
+import multiprocessing
+import time
+
+import pytest
+
+from utils.coordination import Coordinator
+
+
+def _single_flight_worker(db_path, log_path, results):
+    def compute():
+        with open(log_path, "a") as log:
+            log.write("computed\n")
+        # Longer than the lease, so the leader must keep renewing it to hold off the others
+        time.sleep(1.0)
+        return {"plan": "shared"}
+
+    results.put(Coordinator(db_path).single_flight("plan:key", compute, ttl=60, timeout=10, lease=0.3))
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_single_flight_computes_once_across_processes(tmp_path):
+    db_path, log_path = str(tmp_path / "coordination.db"), tmp_path / "computes.log"
+    Coordinator(db_path)
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    workers = [context.Process(target=_single_flight_worker, args=(db_path, str(log_path), results))
+               for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    values = [results.get(timeout=20) for _ in workers]
+    for worker in workers:
+        worker.join(timeout=5)
+
+    assert values == [{"plan": "shared"}] * 4
+    assert log_path.read_text().count("computed") == 1
+
+
+def test_single_flight_refresh_replaces_cached_value(tmp_path):
+    coordinator = Coordinator(str(tmp_path / "coordination.db"))
+    assert coordinator.single_flight("k", lambda: "first", ttl=60) == "first"
+    assert coordinator.single_flight("k", lambda: "second", ttl=60) == "first"
+    assert coordinator.single_flight("k", lambda: "second", ttl=60, refresh=True) == "second"
+    assert coordinator.cache_get("k") == "second"
+
+
+def test_token_bucket_refills_over_time(tmp_path):
+    coordinator = Coordinator(str(tmp_path / "coordination.db"))
+    limits = {"rate_per_second": 20, "capacity": 2}
+
+    assert coordinator.try_acquire("gemini", **limits) == 0
+    assert coordinator.try_acquire("gemini", **limits) == 0
+    wait = coordinator.try_acquire("gemini", **limits)
+    assert 0 < wait <= 1 / 20
+
+    time.sleep(wait + 0.05)
+    assert coordinator.try_acquire("gemini", **limits) == 0
+
+
+def test_token_bucket_is_capped_at_capacity(tmp_path):
+    coordinator = Coordinator(str(tmp_path / "coordination.db"))
+    limits = {"rate_per_second": 100, "capacity": 1}
+
+    assert coordinator.try_acquire("gemini", **limits) == 0
+    time.sleep(0.1)
+    assert coordinator.try_acquire("gemini", **limits) == 0
+    assert coordinator.try_acquire("gemini", **limits) > 0
+
+
+def test_routing_decisions_are_pruned_after_retention(tmp_path):
+    from utils.coordination import ROUTING_RETENTION_SECONDS
+
+    coordinator = Coordinator(str(tmp_path / "coordination.db"))
+    coordinator.record_routing("chat", "fast", "flash", "fast", 100, 0.5, "ok")
+    conn = coordinator._connect()
+    conn.execute("UPDATE routing_decisions SET created_at = ?", (time.time() - ROUTING_RETENTION_SECONDS - 1,))
+    coordinator.record_routing("chat", "standard", "pro", "fast", 100, 0.7, "ok")
+
+    assert [row[0] for row in conn.execute("SELECT tier FROM routing_decisions")] == ["standard"]
+    assert [row["tier"] for row in coordinator.routing_summary()] == ["standard"]
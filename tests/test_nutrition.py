@@ -0,0 +1,19 @@
+import pandas as pd
+import pytest
+
+from utils.nutrition import _goal_category
+
+
+@pytest.mark.parametrize("goals, expected", [
+    ("reduce fatigue in races", "maintain"),
+    ("improve my clean and jerk", "maintain"),
+    ("execute better tactics", "maintain"),
+    ("play again after injury", "maintain"),
+    ("regular massage and mobility", "maintain"),
+    ("lose 5 kg before the season", "loss"),
+    ("cut body fat", "loss"),
+    ("gain muscle mass", "gain"),
+    ("bulk up for rugby", "gain"),
+])
+def test_goal_category_matches_whole_words(goals, expected):
+    assert _goal_category(pd.Series([goals])).iloc[0] == expected
@@ -0,0 +1,28 @@
+import pytest
+
+from utils.render import sanitize_plan_html
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("<strong>Monday</strong> <em>easy run</em>", "<strong>Monday</strong> <em>easy run</em>"),
+    ("<p>Run <b>5 km</b>  then   rest</p>", "<p>Run <b>5 km</b> then rest</p>"),
+    ("<div>\n  <h2>Week 1</h2>\n  <ul>\n    <li>Mon</li>\n  </ul>\n</div>",
+     "<div><h2>Week 1</h2><ul><li>Mon</li></ul></div>"),
+])
+def test_whitespace_dropped_only_between_block_tags(raw, expected):
+    assert sanitize_plan_html(raw) == expected
+
+
+def test_pre_content_is_kept():
+    raw = "<pre>Set   Reps\n  3     10\n</pre>\n<p>Done</p>"
+    assert sanitize_plan_html(raw) == "<pre>Set   Reps\n  3     10\n</pre><p>Done</p>"
+
+
+def test_markdown_lines_are_kept():
+    raw = "## Week 1\n- **Mon** easy run\n  - 20 min\n\nRest on Sunday."
+    assert sanitize_plan_html(raw) == raw
+
+
+def test_disallowed_markup_is_removed():
+    raw = '<p class="day" onclick="x()">Mon</p><script>alert(1)</script><a href="#">link</a>'
+    assert sanitize_plan_html(raw) == '<p class="day">Mon</p>link'
@@ -0,0 +1,35 @@
+import pytest
+
+pytest.importorskip("google.generativeai")
+
+from utils import router
+from utils.router import ModelRouter, get_router
+
+
+def test_get_router_is_shared():
+    assert get_router() is get_router()
+
+
+def test_slow_tier_is_demoted_until_its_latency_expires(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(router.time, "time", lambda: clock[0])
+    model_router = ModelRouter()
+
+    model_router._observe("standard", router.TASK_LATENCY_BUDGET["plan"] + 30)
+    assert model_router.choose_tier("plan", 100) == "fast"
+
+    clock[0] += router.LATENCY_MEMORY_SECONDS + 1
+    assert model_router.choose_tier("plan", 100) == "standard"
+
+
+def test_failed_tier_is_skipped_only_during_cooldown(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(router.time, "time", lambda: clock[0])
+    model_router = ModelRouter()
+
+    model_router._observe_failure("standard")
+    assert model_router.observed_latency("standard") is None
+    assert model_router.choose_tier("plan", 100) == "fast"
+
+    clock[0] += router.FAILURE_COOLDOWN_SECONDS + 1
+    assert model_router.choose_tier("plan", 100) == "standard"
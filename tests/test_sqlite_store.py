@@ -0,0 +1,80 @@
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("firebase_admin")
+
+from utils.sqlite_store import SQLiteStorage
+from utils.storage import StorageBackend
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteStorage(str(tmp_path / "coach.db"))
+
+
+def test_list_plans_pages_through_every_plan_once(store):
+    saved = [store.save_plan("u1", f"<p>plan {i}</p>", 4, "Endurance")["id"] for i in range(7)]
+    store.save_plan("u2", "<p>other user</p>", 4, "Speed")
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        items, cursor = store.list_plans("u1", page_size=3, start_after=cursor)
+        seen += [item["id"] for item in items]
+        pages += 1
+        if cursor is None:
+            break
+
+    assert pages == 3
+    assert sorted(seen) == sorted(saved)
+    assert len(seen) == len(set(seen))
+
+
+def test_list_plans_cursor_breaks_created_at_ties(store, monkeypatch):
+    # Plans saved within the same timestamp must still page without gaps or repeats
+    import utils.sqlite_store as sqlite_store
+
+    class FrozenDatetime(sqlite_store.datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return cls(2024, 1, 1, 12, 0, 0)
+
+    monkeypatch.setattr(sqlite_store, "datetime", FrozenDatetime)
+    saved = {store.save_plan("u1", f"<p>plan {i}</p>", 4, "Endurance")["id"] for i in range(5)}
+
+    first, cursor = store.list_plans("u1", page_size=2)
+    second, cursor = store.list_plans("u1", page_size=2, start_after=cursor)
+    third, cursor = store.list_plans("u1", page_size=2, start_after=cursor)
+
+    assert cursor is None
+    assert {item["id"] for item in first + second + third} == saved
+
+
+def test_batch_commits_all_turns_together(store):
+    with store.batch():
+        store.append_chat_turn("u1", "hello", "hi", sport="Running")
+        store.append_chat_turns("u1", [("plan?", "here", "Running", "plan-1")])
+
+    turns = store.load_recent_turns("u1")
+    assert [turn["message"] for turn in turns] == ["hello", "plan?"]
+    assert turns[-1]["plan_ref"] == "plan-1"
+
+
+def test_batch_rolls_back_on_error(store):
+    store.append_chat_turn("u1", "kept", "yes")
+    with pytest.raises(RuntimeError):
+        with store.batch():
+            store.append_chat_turn("u1", "dropped", "no")
+            store.save_plan("u1", "<p>dropped</p>", 4, "Speed")
+            raise RuntimeError("boom")
+
+    assert [turn["message"] for turn in store.load_recent_turns("u1")] == ["kept"]
+    assert store.list_plans("u1") == ([], None)
+
+
+def test_incomplete_backend_fails_at_construction():
+    class PlansOnly(StorageBackend):
+        def save_plan(self, user_id, plan_html, duration, focus):
+            return {}
+
+    with pytest.raises(TypeError):
+        PlansOnly()
@@ -0,0 +1,108 @@
+# utils/analytics.py
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from utils.chat_store import LAYOUT_BUCKETS, get_chat_layout, sport_count_field
+from utils.knowledge import KNOWLEDGE_BASE
+from utils.profiling import stage
+
+# Admin dashboard numbers are computed with server-side aggregation queries (count/sum/avg)
+# instead of reading documents. Firestore bills an aggregation by index entries scanned
+# (one read per 1,000), so a dashboard load costs a few dozen reads at any data size.
+ANALYTICS_DAYS = int(os.getenv("ANALYTICS_DAYS", "14"))
+SPORTS = list(KNOWLEDGE_BASE)
+# Aggregation queries are independent round trips; run them concurrently
+_QUERY_WORKERS = 8
+
+
+def analytics_window(days: int):
+    """The ISO dates of the last `days` days (oldest first), today included."""
+    today = date.today()
+    return [(today - timedelta(days=offset)).isoformat() for offset in range(days - 1, -1, -1)]
+
+
+def empty_stats(days: int) -> dict:
+    """The shape every backend returns from StorageBackend.analytics()."""
+    return {
+        "days": days,
+        "since": analytics_window(days)[0],
+        "total_users": 0,
+        "active_users": 0,
+        "plans": 0,
+        "avg_plan_duration": None,
+        "chats": 0,
+        "plans_per_day": [{"day": day, "plans": 0} for day in analytics_window(days)],
+        "chats_by_sport": [],
+    }
+
+
+def aggregate(aggregation_query) -> dict:
+    """Run an aggregation query and return its results keyed by alias."""
+    results = aggregation_query.get()
+    return {result.alias: result.value for result in results[0]} if results else {}
+
+
+@stage("analytics.firestore_stats")
+def firestore_stats(db, days: int = ANALYTICS_DAYS, sports=SPORTS) -> dict:
+    """
+    Dashboard aggregates from Firestore count/sum/avg queries.
+    The collection-group range filters need the single-field exemptions and composite
+    indexes in firestore.indexes.json (`firebase deploy --only firestore:indexes`).
+    """
+    stats = empty_stats(days)
+    since = stats["since"]
+    plans = db.collection_group("training_plans")
+    if get_chat_layout() == LAYOUT_BUCKETS:
+        chats = db.collection_group(LAYOUT_BUCKETS).where("started_at", ">=", since)
+
+        def chat_volume(query, sport=None):
+            # A bucket mixes sports; its sport_counts map holds the turns per sport
+            field = sport_count_field(sport) if sport else "turn_count"
+            return query.sum(field, alias="chats")
+    else:
+        chats = db.collection_group("messages").where("timestamp", ">=", since)
+
+        def chat_volume(query, sport=None):
+            return query.where("sport", "==", sport).count(alias="chats") if sport else query.count(alias="chats")
+
+    queries = {
+        "users": db.collection("users").count(alias="users"),
+        # usage/{uid} keeps the time of each user's latest AI request
+        "active": db.collection("usage").where("last_request_at", ">=", since).count(alias="active"),
+        "plans": plans.where("created_at", ">=", since).count(alias="plans").avg("duration", alias="avg_duration"),
+        "chats": chat_volume(chats),
+    }
+    days_list = analytics_window(days)
+    for day, next_day in zip(days_list, days_list[1:] + [(date.today() + timedelta(days=1)).isoformat()]):
+        queries[("day", day)] = (
+            plans.where("created_at", ">=", day).where("created_at", "<", next_day).count(alias="plans")
+        )
+    for sport in sports:
+        queries[("sport", sport)] = chat_volume(chats, sport)
+
+    with ThreadPoolExecutor(max_workers=_QUERY_WORKERS) as pool:
+        results = dict(zip(queries, pool.map(aggregate, queries.values())))
+
+    stats["total_users"] = int(results["users"].get("users") or 0)
+    stats["active_users"] = int(results["active"].get("active") or 0)
+    stats["plans"] = int(results["plans"].get("plans") or 0)
+    stats["avg_plan_duration"] = results["plans"].get("avg_duration")
+    stats["chats"] = int(results["chats"].get("chats") or 0)
+    stats["plans_per_day"] = [
+        {"day": day, "plans": int(results[("day", day)].get("plans") or 0)} for day in days_list
+    ]
+    stats["chats_by_sport"] = [
+        {"sport": sport, "chats": int(results[("sport", sport)].get("chats") or 0)} for sport in sports
+    ]
+    return finish_stats(stats)
+
+
+def finish_stats(stats: dict) -> dict:
+    """Drop sports without chats, sort by volume and count untagged chats (older turns) as 'Unknown'."""
+    by_sport = sorted((row for row in stats["chats_by_sport"] if row["chats"]), key=lambda row: -row["chats"])
+    untagged = stats["chats"] - sum(row["chats"] for row in by_sport)
+    if untagged > 0:
+        by_sport.append({"sport": "Unknown", "chats": untagged})
+    stats["chats_by_sport"] = by_sport
+    return stats
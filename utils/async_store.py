@@ -0,0 +1,124 @@
+# utils/async_store.py
+import asyncio
+import os
+
+from utils import chat_store, plan_store
+from utils.profiling import stage
+from utils.storage import BACKEND_FIRESTORE
+
+# Independent reads (profile, chat history, plan history) are issued concurrently instead of
+# one after another, so loading a session costs about the latency of the slowest read.
+# Each load gets its own semaphore, capping how many reads one session has in flight.
+ASYNC_READ_CONCURRENCY = int(os.getenv("ASYNC_READ_CONCURRENCY", "4"))
+
+
+class AsyncFirestoreReader:
+    """Read-only session data access on the Firestore AsyncClient."""
+
+    def __init__(self, client):
+        self.db = client
+
+    async def get_user(self, user_id):
+        snap = await self.db.collection("users").document(user_id).get()
+        return snap.to_dict() if snap.exists else None
+
+    async def load_recent_turns(self, user_id, limit=200):
+        if chat_store.get_chat_layout() == chat_store.LAYOUT_BUCKETS:
+            turns, cursor = [], None
+            while len(turns) < limit:
+                query = chat_store.recent_turns_query(self.db, user_id, limit, start_after=cursor)
+                page = [snap async for snap in query.stream()]
+                for snap in page:
+                    turns[:0] = snap.to_dict().get("turns", [])
+                if len(page) < chat_store.bucket_page_size(limit):
+                    break
+                cursor = page[-1]
+            return turns[-limit:]
+        query = chat_store.recent_turns_query(self.db, user_id, limit)
+        return [snap.to_dict() async for snap in query.stream()][::-1]
+
+    async def list_plans(self, user_id, page_size=20, start_after=None):
+        query = plan_store.plans_page_query(self.db, user_id, page_size, start_after)
+        return plan_store.plans_page([snap async for snap in query.stream()], page_size)
+
+    async def close(self):
+        close = getattr(self.db, "close", None)
+        result = close() if close is not None else None
+        if asyncio.iscoroutine(result):
+            await result
+
+
+class AsyncStorageAdapter:
+    """
+    Async facade over any synchronous StorageBackend, running each call in a worker thread.
+    Used for the SQLite backend and as a local stand-in for the Firestore async client.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    async def get_user(self, user_id):
+        return await asyncio.to_thread(self.store.get_user, user_id)
+
+    async def load_recent_turns(self, user_id, limit=200):
+        return await asyncio.to_thread(self.store.load_recent_turns, user_id, limit)
+
+    async def list_plans(self, user_id, page_size=20, start_after=None):
+        return await asyncio.to_thread(self.store.list_plans, user_id, page_size, start_after)
+
+    async def close(self):
+        pass
+
+
+def _firestore_async_client():
+    # The AsyncClient binds to the event loop it first runs on, so each load builds its own
+    # rather than reusing firebase_admin.firestore_async.client()
+    import firebase_admin
+    from google.cloud import firestore as gcloud_firestore
+
+    app = firebase_admin.get_app()
+    project = app.project_id or getattr(app.credential, "project_id", None)
+    return gcloud_firestore.AsyncClient(project=project, credentials=app.credential.get_credential())
+
+
+def get_async_reader(store):
+    """An async reader for the given storage backend."""
+    if store.name == BACKEND_FIRESTORE:
+        try:
+            return AsyncFirestoreReader(_firestore_async_client())
+        except Exception as e:
+            print(f"Firestore async client unavailable, reading through worker threads: {e}")
+    return AsyncStorageAdapter(store)
+
+
+async def gather_bounded(*coroutines, limit=ASYNC_READ_CONCURRENCY):
+    """Like asyncio.gather(return_exceptions=True), with at most `limit` coroutines running at once."""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(run(c) for c in coroutines), return_exceptions=True)
+
+
+async def _load_session(reader, user_id, chat_limit, plan_page_size, limit):
+    try:
+        profile, turns, plans = await gather_bounded(
+            reader.get_user(user_id),
+            reader.load_recent_turns(user_id, chat_limit),
+            reader.list_plans(user_id, plan_page_size),
+            limit=limit,
+        )
+    finally:
+        await reader.close()
+    return {"profile": profile, "turns": turns, "plans": plans}
+
+
+@stage("async_store.load_session_data")
+def load_session_data(store, user_id, chat_limit=50, plan_page_size=20, limit=ASYNC_READ_CONCURRENCY):
+    """
+    Load a user's profile, recent chat turns and first page of plans concurrently.
+    Returns {"profile", "turns", "plans"}; a value is the raised exception if that read failed.
+    """
+    return asyncio.run(_load_session(get_async_reader(store), user_id, chat_limit, plan_page_size, limit))
@@ -1,9 +1,10 @@
+import os
 import streamlit as st
 import firebase_admin
-from firebase_admin import auth, credentials
-from firebase_admin import firestore
+from firebase_admin import credentials
 from firebase_admin.exceptions import FirebaseError
-from utils.db import get_db
+from datetime import datetime
+from utils.storage import get_storage, AccountExistsError, AccountNotFoundError
 
 def initialize_firebase_auth():
     try:
@@ -16,27 +17,23 @@ def initialize_firebase_auth():
     return True
 
 def register_user(email, password, user_data):
-    if not initialize_firebase_auth():
+    store = get_storage()
+    if store is None:
         return None
         
     try:
-        user = auth.create_user(
-            email=email,
-            password=password,
-            display_name=user_data.get('name', '')
-        )
+        uid = store.create_account(email, password, user_data.get('name', ''))
         
-        # Add additional user data to Firestore
-        db = get_db()
-        user_data['uid'] = user.uid
-        user_data['created_at'] = firestore.SERVER_TIMESTAMP
+        # Add additional user data to the profile store
+        user_data['uid'] = uid
+        user_data['created_at'] = datetime.now().isoformat()
         
-        db.collection('users').document(user.uid).set(user_data)
-        return user.uid
+        store.set_user(uid, user_data, merge=False)
+        return uid
         
     except ValueError as e:
         st.error(f"Invalid data: {e}")
-    except auth.EmailAlreadyExistsError:
+    except AccountExistsError:
         st.error("Email already exists")
     except FirebaseError as e:
         st.error(f"Firebase error: {e.code} - {e.message}")
@@ -46,19 +43,24 @@ def register_user(email, password, user_data):
     return None
 
 def authenticate_user(email, password):
-    if not initialize_firebase_auth():
+    store = get_storage()
+    if store is None:
         return None
         
     try:
-        # Note: Firebase Admin SDK doesn't have password verification
-        # For actual auth, you need Firebase Client SDK or REST API
-        user = auth.get_user_by_email(email)
-        return user.uid
-    except auth.UserNotFoundError:
+        # Note: the Firestore backend can't verify passwords with the Admin SDK;
+        # the SQLite backend checks them against its local account table
+        return store.authenticate(email, password)
+    except AccountNotFoundError:
         st.error("User not found")
     except FirebaseError as e:
         st.error(f"Authentication error: {e.code} - {e.message}")
     except Exception as e:
         st.error(f"Login failed: {str(e)}")
     
-    return None
\ No newline at end of file
+    return None
+
+def is_admin(user_id):
+    """Admins are listed by uid in the comma-separated ADMIN_UIDS environment variable."""
+    admins = {uid.strip() for uid in os.getenv("ADMIN_UIDS", "").split(",") if uid.strip()}
+    return bool(user_id) and user_id in admins
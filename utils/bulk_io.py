@@ -0,0 +1,220 @@
+# utils/bulk_io.py
+"""
+Streaming bulk export/import of Firestore collections to gzip-compressed JSONL.
+
+    python -m utils.bulk_io export --dir backup/
+    python -m utils.bulk_io import --dir backup/ --collections users plans
+
+Each collection is written as numbered parts <dir>/<name>.<n>.jsonl.gz, one per page, with
+one {"path", "data"} record per document. A part is complete and closed before the
+checkpoint <dir>/<name>.checkpoint.json records it, so a crash never leaves a truncated
+gzip stream behind; an interrupted run rewrites the unrecorded part when started again.
+Imports checkpoint after every batch the same way. Delete the checkpoint files (or use a
+new directory) to start a collection over.
+"""
+import argparse
+import base64
+import glob
+import gzip
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from firebase_admin import firestore
+
+# Logical collections and the Firestore sources that make them up:
+# ("collection", id) is a top-level collection, ("group", id) a collection group query
+COLLECTIONS = {
+    "users": [("collection", "users")],
+    "plans": [("group", "training_plans")],
+    "plan_bodies": [("collection", "plan_bodies")],
+    "chats": [("collection", "chats"), ("group", "messages"), ("group", "buckets")],
+}
+
+PAGE_SIZE = 500
+# Firestore allows at most 500 operations per batch
+BATCH_LIMIT = 500
+
+
+def _encode(value):
+    """Convert Firestore values into JSON-safe structures."""
+    if isinstance(value, bytes):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, firestore.DocumentReference):
+        return {"__ref__": value.path}
+    if isinstance(value, firestore.GeoPoint):
+        return {"__geo__": [value.latitude, value.longitude]}
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_encode(v) for v in value]
+    return value
+
+
+def _decode(value, db):
+    if isinstance(value, dict):
+        if len(value) == 1:
+            (key, inner), = value.items()
+            if key == "__bytes__":
+                return base64.b64decode(inner)
+            if key == "__datetime__":
+                return datetime.fromisoformat(inner)
+            if key == "__ref__":
+                return db.document(inner)
+            if key == "__geo__":
+                return firestore.GeoPoint(*inner)
+        return {k: _decode(v, db) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v, db) for v in value]
+    return value
+
+
+def _part_path(directory, name, part):
+    return os.path.join(directory, f"{name}.{part:05d}.jsonl.gz")
+
+
+def _part_paths(directory, name):
+    return sorted(glob.glob(os.path.join(glob.escape(directory), f"{glob.escape(name)}.[0-9]*.jsonl.gz")))
+
+
+def _checkpoint_path(directory, name, kind="checkpoint"):
+    return os.path.join(directory, f"{name}.{kind}.json")
+
+
+def _write_part(path, records):
+    # Written to a temporary file and renamed, so a part either exists complete or not at all
+    tmp = f"{path}.tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8") as out:
+        for record in records:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
+
+
+def _load_checkpoint(path):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+
+def _save_checkpoint(path, checkpoint):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+
+def _source_query(db, kind, source_id):
+    query = db.collection_group(source_id) if kind == "group" else db.collection(source_id)
+    return query.order_by("__name__")
+
+
+def export_collection(db, name, directory, page_size=PAGE_SIZE):
+    """Stream one logical collection to gzip JSONL parts, page by page. Returns the number of exported documents."""
+    checkpoint_path = _checkpoint_path(directory, name)
+    checkpoint = _load_checkpoint(checkpoint_path)
+    if checkpoint.get("done"):
+        return checkpoint.get("count", 0)
+    if not checkpoint:
+        # Fresh export: drop parts left by an earlier run without a checkpoint
+        for path in _part_paths(directory, name):
+            os.remove(path)
+        checkpoint = {"source": 0, "last_path": None, "count": 0, "parts": 0, "done": False}
+
+    sources = COLLECTIONS[name]
+    while checkpoint["source"] < len(sources):
+        kind, source_id = sources[checkpoint["source"]]
+        cursor = db.document(checkpoint["last_path"]).get() if checkpoint["last_path"] else None
+        while True:
+            query = _source_query(db, kind, source_id).limit(page_size)
+            if cursor is not None:
+                query = query.start_after(cursor)
+            page = list(query.stream())
+            if page:
+                _write_part(_part_path(directory, name, checkpoint["parts"]),
+                            ({"path": snap.reference.path, "data": _encode(snap.to_dict())} for snap in page))
+                cursor = page[-1]
+                checkpoint["last_path"] = cursor.reference.path
+                checkpoint["count"] += len(page)
+                checkpoint["parts"] += 1
+                _save_checkpoint(checkpoint_path, checkpoint)
+            if len(page) < page_size:
+                break
+        checkpoint["source"] += 1
+        checkpoint["last_path"] = None
+        _save_checkpoint(checkpoint_path, checkpoint)
+
+    checkpoint["done"] = True
+    _save_checkpoint(checkpoint_path, checkpoint)
+    return checkpoint["count"]
+
+
+def import_collection(db, name, directory, batch_limit=BATCH_LIMIT):
+    """Stream one logical collection from gzip JSONL parts into Firestore in batched writes. Returns the number of imported documents."""
+    checkpoint_path = _checkpoint_path(directory, name, "import-checkpoint")
+    parts = _part_paths(directory, name)
+    if not parts:
+        return 0
+    checkpoint = _load_checkpoint(checkpoint_path) or {"part": 0, "lines": 0, "count": 0, "done": False}
+    if checkpoint.get("done"):
+        return checkpoint["count"]
+
+    # Position is (part, line within part); it only advances after the batch holding those lines commits
+    batch, pending = db.batch(), 0
+    for part in range(checkpoint["part"], len(parts)):
+        with gzip.open(parts[part], "rt", encoding="utf-8") as f:
+            for line_no, line in enumerate(f):
+                if (part == checkpoint["part"] and line_no < checkpoint["lines"]) or not line.strip():
+                    continue
+                record = json.loads(line)
+                batch.set(db.document(record["path"]), _decode(record["data"], db))
+                pending += 1
+                if pending >= batch_limit:
+                    batch.commit()
+                    checkpoint.update(part=part, lines=line_no + 1, count=checkpoint["count"] + pending)
+                    _save_checkpoint(checkpoint_path, checkpoint)
+                    batch, pending = db.batch(), 0
+        if pending == 0:
+            checkpoint.update(part=part + 1, lines=0)
+    if pending:
+        batch.commit()
+    checkpoint.update(part=len(parts), lines=0, count=checkpoint["count"] + pending, done=True)
+    _save_checkpoint(checkpoint_path, checkpoint)
+    return checkpoint["count"]
+
+
+def run_parallel(fn, db, names, directory, workers):
+    """Run an export/import function over several collections with one worker per collection."""
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fn, db, name, directory): name for name in names}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk export/import of users, plans and chats")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("--dir", required=True, help="Directory for .jsonl.gz files and checkpoints")
+    parser.add_argument("--collections", nargs="+", choices=list(COLLECTIONS), default=list(COLLECTIONS))
+    parser.add_argument("--workers", type=int, default=len(COLLECTIONS), help="Parallel collection workers")
+    args = parser.parse_args()
+
+    from utils.db import get_db
+    db = get_db()
+    if db is None:
+        raise SystemExit("Database not initialized")
+
+    os.makedirs(args.dir, exist_ok=True)
+    fn = export_collection if args.command == "export" else import_collection
+    results = run_parallel(fn, db, args.collections, args.dir, args.workers)
+    for name in args.collections:
+        print(f"{name}: {args.command}ed {results[name]} documents")
+
+
+if __name__ == "__main__":
+    main()
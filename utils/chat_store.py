@@ -0,0 +1,259 @@
+# utils/chat_store.py
+import argparse
+import json
+import math
+import os
+from datetime import datetime
+
+from firebase_admin import firestore
+
+from utils.profiling import stage
+
+# Two storage layouts are supported for chat turns:
+#   "messages" - one document per turn in chats/{uid}/messages (original layout)
+#   "buckets"  - turns appended to time-ordered documents in chats/{uid}/buckets, so
+#                reading a long conversation costs one read per bucket instead of per turn.
+# A head pointer on chats/{uid} tracks the bucket currently being filled. Buckets roll over only
+# on turn count and size; per-sport turn counts are kept in each bucket's sport_counts map.
+LAYOUT_MESSAGES = "messages"
+LAYOUT_BUCKETS = "buckets"
+
+BUCKET_MAX_TURNS = int(os.getenv("CHAT_BUCKET_MAX_TURNS", "100"))
+# Firestore documents are capped at 1 MiB; leave headroom for field names and indexes
+BUCKET_MAX_BYTES = int(os.getenv("CHAT_BUCKET_MAX_BYTES", "800000"))
+
+# Firestore allows at most 500 operations per batch
+_BATCH_LIMIT = 500
+
+
+def get_chat_layout() -> str:
+    layout = os.getenv("CHAT_STORAGE_LAYOUT", LAYOUT_MESSAGES).lower()
+    return layout if layout in (LAYOUT_MESSAGES, LAYOUT_BUCKETS) else LAYOUT_MESSAGES
+
+
+def _chat_doc(db, user_id: str):
+    return db.collection("chats").document(user_id)
+
+
+def _turn_size(turn: dict) -> int:
+    return len(json.dumps(turn, ensure_ascii=False).encode("utf-8"))
+
+
+def _new_bucket_id(started_at: str) -> str:
+    # Sortable id derived from the first turn's timestamp
+    return started_at.replace("-", "").replace(":", "").replace(".", "")
+
+
+def _needs_rollover(head: dict, size: int) -> bool:
+    return (
+        not head.get("head_bucket")
+        or head.get("head_turns", 0) >= BUCKET_MAX_TURNS
+        or head.get("head_bytes", 0) + size > BUCKET_MAX_BYTES
+    )
+
+
+def _count_sport(counts: dict, sport: str = None) -> dict:
+    # Turns without a sport are left out; analytics reports them as "Unknown"
+    return {**counts, sport: counts.get(sport, 0) + 1} if sport else dict(counts)
+
+
+def sport_count_field(sport: str) -> str:
+    """Field path of a sport's turn count on a bucket, quoted for names like "Table Tennis"."""
+    return firestore.FieldPath("sport_counts", sport).to_api_repr()
+
+
+@firestore.transactional
+def _append_to_bucket(transaction, chat_ref, turn: dict):
+    size = _turn_size(turn)
+    head_snap = chat_ref.get(transaction=transaction)
+    head = head_snap.to_dict() if head_snap.exists else {}
+
+    if _needs_rollover(head, size):
+        bucket_id = _new_bucket_id(turn["timestamp"])
+        sport_counts = _count_sport({}, turn.get("sport"))
+        transaction.set(chat_ref.collection(LAYOUT_BUCKETS).document(bucket_id), {
+            "turns": [turn],
+            "turn_count": 1,
+            "bytes": size,
+            "sport_counts": sport_counts,
+            "started_at": turn["timestamp"],
+            "updated_at": turn["timestamp"],
+        })
+        head = {"head_bucket": bucket_id, "head_turns": 1, "head_bytes": size, "head_sport_counts": sport_counts}
+    else:
+        bucket_id = head["head_bucket"]
+        # The head mirrors the bucket's counts, so the whole map is written without reading the bucket
+        sport_counts = _count_sport(head.get("head_sport_counts", {}), turn.get("sport"))
+        transaction.update(chat_ref.collection(LAYOUT_BUCKETS).document(bucket_id), {
+            "turns": firestore.ArrayUnion([turn]),
+            "turn_count": firestore.Increment(1),
+            "bytes": firestore.Increment(size),
+            "sport_counts": sport_counts,
+            "updated_at": turn["timestamp"],
+        })
+        head = {
+            "head_bucket": bucket_id,
+            "head_turns": head.get("head_turns", 0) + 1,
+            "head_bytes": head.get("head_bytes", 0) + size,
+            "head_sport_counts": sport_counts,
+        }
+    transaction.set(chat_ref, head, merge=True)
+
+
+@stage("chat_store.append_chat_turn")
+def append_chat_turn(db, user_id: str, message: str, response: str, layout: str = None, sport: str = None,
+                     plan_ref: str = None):
+    """
+    Persist one chat turn using the configured layout. The athlete's sport is kept for analytics.
+    Replies that carry a plan store only its plan_ref; the body lives once in plan_bodies.
+    """
+    turn = {"message": message, "response": response, "timestamp": datetime.now().isoformat(), "sport": sport}
+    if plan_ref:
+        turn["plan_ref"] = plan_ref
+    if (layout or get_chat_layout()) == LAYOUT_BUCKETS:
+        _append_to_bucket(db.transaction(), _chat_doc(db, user_id), turn)
+    else:
+        _chat_doc(db, user_id).collection(LAYOUT_MESSAGES).add(turn)
+
+
+def bucket_page_size(limit: int) -> int:
+    # Enough full buckets to cover `limit` turns plus the partly filled head bucket;
+    # buckets cut short by the size limit are covered by fetching further pages
+    return math.ceil(limit / BUCKET_MAX_TURNS) + 1
+
+
+def recent_turns_query(db, user_id: str, limit: int = 200, layout: str = None, start_after=None):
+    """
+    Query for the newest turns (or one page of buckets), newest first; works with the sync and async clients.
+    Bucket pages hold bucket_page_size(limit) documents; pass the last snapshot as start_after for the next page.
+    """
+    chat_ref = _chat_doc(db, user_id)
+    if (layout or get_chat_layout()) == LAYOUT_BUCKETS:
+        query = (
+            chat_ref.collection(LAYOUT_BUCKETS)
+            .order_by("started_at", direction="DESCENDING")
+            .limit(bucket_page_size(limit))
+        )
+        return query.start_after(start_after) if start_after is not None else query
+    return (
+        chat_ref.collection(LAYOUT_MESSAGES)
+        .order_by("timestamp", direction="DESCENDING")
+        .limit(limit)
+    )
+
+
+@stage("chat_store.load_recent_turns")
+def load_recent_turns(db, user_id: str, limit: int = 200, layout: str = None):
+    """Return up to `limit` most recent turns, oldest first."""
+    if (layout or get_chat_layout()) == LAYOUT_BUCKETS:
+        turns, cursor = [], None
+        while len(turns) < limit:
+            page = list(recent_turns_query(db, user_id, limit, LAYOUT_BUCKETS, start_after=cursor).stream())
+            for snap in page:
+                turns[:0] = snap.to_dict().get("turns", [])
+            if len(page) < bucket_page_size(limit):
+                break
+            cursor = page[-1]
+        return turns[-limit:]
+    query = recent_turns_query(db, user_id, limit, layout)
+    return [snap.to_dict() for snap in query.stream()][::-1]
+
+
+def to_chat_history(turns):
+    """Expand stored turns into the role/content messages kept in st.session_state.chat_history."""
+    history = []
+    for turn in turns:
+        history.append({"role": "user", "content": turn.get("message", "")})
+        reply = {"role": "assistant", "content": turn.get("response", "")}
+        if turn.get("plan_ref"):
+            reply["plan_ref"] = turn["plan_ref"]
+        history.append(reply)
+    return history
+
+
+def migrate_user(db, user_id: str, delete_source: bool = False, force: bool = False) -> int:
+    """
+    Copy a user's chats/{uid}/messages documents into bucketed documents.
+    Returns the number of migrated turns. Users that already have buckets are skipped unless force=True.
+    """
+    chat_ref = _chat_doc(db, user_id)
+    head_snap = chat_ref.get()
+    if head_snap.exists and head_snap.to_dict().get("head_bucket") and not force:
+        return 0
+
+    messages = chat_ref.collection(LAYOUT_MESSAGES).order_by("timestamp").stream()
+    batch, ops, migrated = db.batch(), 0, 0
+    bucket, head, source_refs = None, {}, []
+
+    def flush_bucket():
+        nonlocal batch, ops
+        if not bucket:
+            return
+        batch.set(chat_ref.collection(LAYOUT_BUCKETS).document(head["head_bucket"]), bucket)
+        ops += 1
+        if ops >= _BATCH_LIMIT:
+            batch.commit()
+            batch, ops = db.batch(), 0
+
+    for snap in messages:
+        data = snap.to_dict()
+        turn = {
+            "message": data.get("message", ""),
+            "response": data.get("response", ""),
+            "timestamp": data.get("timestamp") or datetime.now().isoformat(),
+            "sport": data.get("sport"),
+        }
+        if data.get("plan_ref"):
+            turn["plan_ref"] = data["plan_ref"]
+        size = _turn_size(turn)
+        if _needs_rollover(head, size):
+            flush_bucket()
+            head = {"head_bucket": _new_bucket_id(turn["timestamp"]), "head_turns": 0, "head_bytes": 0,
+                    "head_sport_counts": {}}
+            bucket = {"turns": [], "turn_count": 0, "bytes": 0, "sport_counts": {},
+                      "started_at": turn["timestamp"], "updated_at": turn["timestamp"]}
+        bucket["turns"].append(turn)
+        bucket["turn_count"] += 1
+        bucket["bytes"] += size
+        bucket["sport_counts"] = _count_sport(bucket["sport_counts"], turn["sport"])
+        bucket["updated_at"] = turn["timestamp"]
+        head["head_turns"] += 1
+        head["head_bytes"] += size
+        head["head_sport_counts"] = bucket["sport_counts"]
+        source_refs.append(snap.reference)
+        migrated += 1
+
+    flush_bucket()
+    if head:
+        batch.set(chat_ref, head, merge=True)
+    batch.commit()
+
+    if delete_source:
+        for start in range(0, len(source_refs), _BATCH_LIMIT):
+            delete_batch = db.batch()
+            for ref in source_refs[start:start + _BATCH_LIMIT]:
+                delete_batch.delete(ref)
+            delete_batch.commit()
+    return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate chat history to the bucketed layout")
+    parser.add_argument("--uid", action="append", help="User id to migrate (repeatable). Defaults to all users.")
+    parser.add_argument("--delete-source", action="store_true", help="Delete per-turn documents after migrating")
+    parser.add_argument("--force", action="store_true", help="Re-migrate users that already have buckets")
+    args = parser.parse_args()
+
+    from utils.db import get_db
+    db = get_db()
+    if db is None:
+        raise SystemExit("Database not initialized")
+
+    user_ids = args.uid or [ref.id for ref in db.collection("chats").list_documents()]
+    for user_id in user_ids:
+        count = migrate_user(db, user_id, delete_source=args.delete_source, force=args.force)
+        print(f"{user_id}: migrated {count} turns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# utils/context_cache.py
+import hashlib
+import os
+import threading
+import time
+from datetime import timedelta
+
+import google.generativeai as genai
+
+from utils.coordination import get_coordinator
+
+# Stable prompt prefixes (persona, format spec, athlete profile) are registered once with the
+# provider's context cache and reused across requests, so each turn only sends the small
+# variable suffix. CONTEXT_CACHE selects the provider: "gemini", "fake" (local, for tests) or "off".
+CONTEXT_CACHE_PROVIDER = os.getenv("CONTEXT_CACHE", "gemini").lower()
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("CONTEXT_CACHE_TTL", "1800"))
+# Providers reject prefixes below a minimum size (32,768 tokens for Gemini 1.5); shorter ones are sent inline
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", "32768"))
+# Rough characters-per-token ratio, to avoid a count_tokens round trip per request
+_CHARS_PER_TOKEN = 4
+# Re-register a prefix this long before its cache entry expires
+_REFRESH_MARGIN_SECONDS = 60
+
+
+class GeminiCacheProvider:
+    """Context caching through google.generativeai.caching.CachedContent."""
+
+    # Cache entries live at the provider, so other server processes can reuse them by name
+    shared = True
+
+    def create(self, model_name, prefix, ttl_seconds):
+        from google.generativeai import caching
+        cached = caching.CachedContent.create(
+            model=model_name, contents=[prefix], ttl=timedelta(seconds=ttl_seconds)
+        )
+        return cached.name
+
+    def model_for(self, model_name, cache_name):
+        from google.generativeai import caching
+        return genai.GenerativeModel.from_cached_content(cached_content=caching.CachedContent.get(cache_name))
+
+    def delete(self, cache_name):
+        from google.generativeai import caching
+        caching.CachedContent.get(cache_name).delete()
+
+
+class _FakeCachedModel:
+    def __init__(self, provider, model_name, prefix):
+        self.provider = provider
+        self.model_name = model_name
+        self.prefix = prefix
+
+    def generate_content(self, contents, **kwargs):
+        self.provider.stats["hits"] += 1
+        self.provider.stats["prefix_chars_reused"] += len(self.prefix)
+        suffix = [contents] if isinstance(contents, str) else list(contents)
+        if self.provider.generate is not None:
+            return self.provider.generate(self.model_name, [self.prefix] + suffix, **kwargs)
+        return genai.GenerativeModel(self.model_name).generate_content([self.prefix] + suffix, **kwargs)
+
+
+class FakeCacheProvider:
+    """
+    Local stand-in for provider context caching. Prefixes are kept in memory and prepended on
+    each call, and stats count how much prefix text was reused. Pass generate(model_name, contents)
+    to run without a real model.
+    """
+
+    shared = False
+
+    def __init__(self, generate=None):
+        self.generate = generate
+        self.entries = {}
+        self.stats = {"created": 0, "deleted": 0, "hits": 0, "prefix_chars_reused": 0}
+
+    def create(self, model_name, prefix, ttl_seconds):
+        name = f"cachedContents/fake-{self.stats['created']}"
+        self.entries[name] = prefix
+        self.stats["created"] += 1
+        return name
+
+    def model_for(self, model_name, cache_name):
+        return _FakeCachedModel(self, model_name, self.entries[cache_name])
+
+    def delete(self, cache_name):
+        if self.entries.pop(cache_name, None) is not None:
+            self.stats["deleted"] += 1
+
+
+class PrefixCache:
+    """Maps (model, prefix) to a provider cache entry, creating and refreshing entries on demand."""
+
+    def __init__(self, provider, ttl_seconds=CONTEXT_CACHE_TTL_SECONDS, min_tokens=CONTEXT_CACHE_MIN_TOKENS):
+        self.provider = provider
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self._entries = {}   # key -> (cache_name, expires_at)
+        self._owners = {}    # (owner, model_name) -> key currently registered for that owner
+        self._failed = set()
+        self._lock = threading.Lock()
+
+    def _key(self, model_name, prefix):
+        return hashlib.sha256(f"{model_name}\n{prefix}".encode("utf-8")).hexdigest()
+
+    def model_for(self, model_name, prefix, owner=None):
+        """
+        Return a model bound to the cached prefix, or None when the prefix must be sent inline
+        (too small to cache, caching disabled, or the provider refused it).
+        The owner (e.g. uid + task) lets a changed profile replace its previous cache entry.
+        """
+        if len(prefix) < self.min_tokens * _CHARS_PER_TOKEN:
+            return None
+        key = self._key(model_name, prefix)
+        now = time.time()
+        with self._lock:
+            if key in self._failed:
+                return None
+            entry = self._entries.get(key)
+        coordinator = get_coordinator() if getattr(self.provider, "shared", False) else None
+
+        if entry is None or entry[1] - _REFRESH_MARGIN_SECONDS < now:
+            # Another server process may already have registered this prefix
+            shared = coordinator.cache_get(f"context:{key}") if coordinator else None
+            if shared and shared[1] - _REFRESH_MARGIN_SECONDS > now:
+                entry = tuple(shared)
+            else:
+                try:
+                    entry = (self.provider.create(model_name, prefix, self.ttl_seconds), now + self.ttl_seconds)
+                except Exception as e:
+                    print(f"Context cache registration failed, sending prefix inline: {e}")
+                    with self._lock:
+                        self._failed.add(key)
+                    return None
+                if coordinator:
+                    coordinator.cache_set(f"context:{key}", list(entry), self.ttl_seconds)
+
+        stale = previous = None
+        with self._lock:
+            self._entries[key] = entry
+            if owner is not None:
+                previous = self._owners.get((owner, model_name))
+                self._owners[(owner, model_name)] = key
+                if previous and previous != key and previous not in self._owners.values():
+                    stale = self._entries.pop(previous, None)
+        if stale:
+            # The owner's prefix changed (e.g. profile edited); drop the outdated entry early
+            if coordinator:
+                coordinator.cache_set(f"context:{previous}", None, 0)
+            try:
+                self.provider.delete(stale[0])
+            except Exception:
+                pass
+        try:
+            return self.provider.model_for(model_name, entry[0])
+        except Exception as e:
+            # Expired or deleted by another process; the next request registers it again
+            print(f"Context cache entry unavailable, sending prefix inline: {e}")
+            self.invalidate(model_name, prefix)
+            return None
+
+    def invalidate(self, model_name, prefix):
+        """Forget the cache entry for a prefix here and in the shared store."""
+        key = self._key(model_name, prefix)
+        with self._lock:
+            self._entries.pop(key, None)
+        coordinator = get_coordinator() if getattr(self.provider, "shared", False) else None
+        if coordinator:
+            coordinator.cache_set(f"context:{key}", None, 0)
+
+
+_prefix_cache = None
+
+
+def get_prefix_cache():
+    """Returns the process-wide prefix cache, or None when context caching is off."""
+    global _prefix_cache
+    if _prefix_cache is None and CONTEXT_CACHE_PROVIDER != "off":
+        if CONTEXT_CACHE_PROVIDER == "fake":
+            # The fake has no minimum size, so every prefix exercises the cached path
+            _prefix_cache = PrefixCache(FakeCacheProvider(), min_tokens=0)
+        else:
+            _prefix_cache = PrefixCache(GeminiCacheProvider())
+    return _prefix_cache
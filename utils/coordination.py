@@ -0,0 +1,311 @@
+# utils/coordination.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from utils.profiling import stage
+from utils.usage import add_model_usage
+
+# Cross-process coordination for LLM calls: a shared response cache, a shared token-bucket
+# request budget and single-flight deduplication of identical generations. State lives in a
+# SQLite file that every Streamlit server process on the host opens, so replicas share one
+# cache and one quota instead of each keeping their own.
+COORDINATION_DB_PATH = os.getenv("COORDINATION_DB_PATH", "coordination.db")
+# Shared Gemini request budget: sustained requests per minute and burst size
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "60"))
+GEMINI_BURST = float(os.getenv("GEMINI_BURST", "10"))
+# How long a caller waits for budget or for another process's identical generation
+BUDGET_TIMEOUT_SECONDS = float(os.getenv("GEMINI_BUDGET_TIMEOUT", "30"))
+SINGLE_FLIGHT_TIMEOUT_SECONDS = float(os.getenv("SINGLE_FLIGHT_TIMEOUT", "600"))
+# A leader renews its in-flight lease every third of this while it computes, so followers keep
+# waiting on long router fallbacks but take over within one lease if the leader process dies
+SINGLE_FLIGHT_LEASE_SECONDS = float(os.getenv("SINGLE_FLIGHT_LEASE", "30"))
+# Routing decisions older than this are deleted; it is also the routing_summary window
+ROUTING_RETENTION_SECONDS = float(os.getenv("ROUTING_RETENTION", "86400"))
+
+_POLL_SECONDS = 0.25
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache (expires_at);
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS inflight (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS routing_decisions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    task TEXT NOT NULL,
+    tier TEXT NOT NULL,
+    model TEXT NOT NULL,
+    chosen_tier TEXT NOT NULL,
+    prompt_chars INTEGER NOT NULL,
+    latency REAL NOT NULL,
+    outcome TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_routing_created ON routing_decisions (created_at);
+"""
+
+
+class BudgetExceededError(Exception):
+    """Raised when the shared request budget stays exhausted for longer than the timeout."""
+
+
+class Coordinator:
+    """Shared cache, token bucket and single-flight backed by one SQLite file."""
+
+    def __init__(self, path: str = COORDINATION_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        # IMMEDIATE takes the write lock up front so read-modify-write is atomic across processes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    # Cache
+    def cache_get(self, key: str):
+        row = self._connect().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def cache_set(self, key: str, value, ttl: float):
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), now + ttl),
+            )
+            conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+
+    # Token bucket
+    def try_acquire(self, bucket: str, tokens: float = 1, rate_per_second: float = GEMINI_RPM / 60,
+                    capacity: float = GEMINI_BURST) -> float:
+        """Take tokens if available. Returns 0 on success, otherwise the seconds until enough refill."""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE name = ?", (bucket,)).fetchone()
+            available = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate_per_second)
+            wait = 0.0
+            if available >= tokens:
+                available -= tokens
+            else:
+                wait = (tokens - available) / rate_per_second
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+                (bucket, available, now),
+            )
+        return wait
+
+    def acquire(self, bucket: str, tokens: float = 1, timeout: float = BUDGET_TIMEOUT_SECONDS, **limits):
+        """Block until the shared bucket grants the tokens, or raise BudgetExceededError."""
+        deadline = time.time() + timeout
+        while True:
+            wait = self.try_acquire(bucket, tokens, **limits)
+            if wait == 0:
+                return
+            if time.time() + wait > deadline:
+                raise BudgetExceededError(f"Shared '{bucket}' budget exhausted; retry in {wait:.0f}s")
+            time.sleep(min(wait, 1.0))
+
+    # Single-flight
+    def _claim(self, key: str, owner: str, lease: float) -> bool:
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT expires_at FROM inflight WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[0] > now:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO inflight (key, owner, expires_at) VALUES (?, ?, ?)",
+                (key, owner, now + lease),
+            )
+            return True
+
+    def _renew(self, key: str, owner: str, lease: float):
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE inflight SET expires_at = ? WHERE key = ? AND owner = ?", (time.time() + lease, key, owner)
+            )
+
+    @contextmanager
+    def _lease(self, key: str, owner: str, lease: float):
+        """Keep a claimed key's lease alive from a heartbeat thread until the block exits, then release it."""
+        stop = threading.Event()
+
+        def heartbeat():
+            while not stop.wait(lease / 3):
+                try:
+                    self._renew(key, owner, lease)
+                except sqlite3.Error as e:
+                    print(f"Failed to renew single-flight lease: {e}")
+
+        thread = threading.Thread(target=heartbeat, name="single-flight-lease", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+            self._release(key, owner)
+
+    def _release(self, key: str, owner: str):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM inflight WHERE key = ? AND owner = ?", (key, owner))
+
+    def _is_inflight(self, key: str) -> bool:
+        row = self._connect().execute(
+            "SELECT 1 FROM inflight WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row is not None
+
+    def single_flight(self, key: str, compute, ttl: float, timeout: float = SINGLE_FLIGHT_TIMEOUT_SECONDS,
+                      lease: float = SINGLE_FLIGHT_LEASE_SECONDS, refresh: bool = False):
+        """
+        Return the cached value for key, computing it at most once across all processes.
+        Callers that find an identical computation in flight wait for its result instead of repeating it.
+        refresh=True ignores the cached value and replaces it with a new computation.
+        """
+        # On refresh, the value cached before this call doesn't count as a result
+        stale = self.cache_get(key) if refresh else None
+
+        def fresh_cached():
+            value = self.cache_get(key)
+            return None if value == stale else value
+
+        cached = fresh_cached()
+        if cached is not None:
+            return cached
+
+        owner = uuid.uuid4().hex
+        deadline = time.time() + timeout
+        while True:
+            if self._claim(key, owner, lease=lease):
+                with self._lease(key, owner, lease):
+                    value = compute()
+                    if value is not None:
+                        self.cache_set(key, value, ttl)
+                    return value
+
+            # Another process is computing the same key; wait for its result
+            while self._is_inflight(key) and time.time() < deadline:
+                time.sleep(_POLL_SECONDS)
+                cached = fresh_cached()
+                if cached is not None:
+                    return cached
+            cached = fresh_cached()
+            if cached is not None:
+                return cached
+            if time.time() >= deadline:
+                # The leader is stuck; don't block the user any longer
+                return compute()
+            # The leader failed without a result; try to take over
+
+    # Routing log
+    def record_routing(self, task, tier, model, chosen_tier, prompt_chars, latency, outcome):
+        """Record one model call attempt so tier choices can be tuned against cost and latency."""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO routing_decisions "
+                "(created_at, task, tier, model, chosen_tier, prompt_chars, latency, outcome) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (now, task, tier, model, chosen_tier, prompt_chars, latency, outcome),
+            )
+            conn.execute("DELETE FROM routing_decisions WHERE created_at <= ?", (now - ROUTING_RETENTION_SECONDS,))
+
+    def routing_summary(self, since_seconds: float = ROUTING_RETENTION_SECONDS):
+        """Per task and tier: attempts, failures and latency over the recent window."""
+        cursor = self._connect().execute(
+            "SELECT task, tier, model, COUNT(*) AS attempts, "
+            "SUM(outcome != 'ok') AS failures, SUM(tier != chosen_tier) AS fallbacks, "
+            "AVG(latency) AS avg_latency, MAX(latency) AS max_latency, AVG(prompt_chars) AS avg_prompt_chars "
+            "FROM routing_decisions WHERE created_at > ? GROUP BY task, tier, model ORDER BY task, tier",
+            (time.time() - since_seconds,),
+        )
+        columns = [c[0] for c in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+_coordinator = None
+_coordinator_lock = threading.Lock()
+
+
+def get_coordinator():
+    """Returns the process-wide coordinator, or None if the shared store is unavailable."""
+    global _coordinator
+    if _coordinator is None:
+        with _coordinator_lock:
+            if _coordinator is None:
+                try:
+                    _coordinator = Coordinator()
+                except sqlite3.Error as e:
+                    print(f"Coordination store unavailable, running uncoordinated: {e}")
+                    return None
+    return _coordinator
+
+
+def generation_key(model_name: str, contents) -> str:
+    payload = json.dumps([model_name, contents], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@stage("coordination.cached_generate")
+def cached_generate(model, contents, ttl: float, refresh: bool = False, **route_hints):
+    """
+    Generate text through the shared cache, budget and single-flight.
+    model is either a Gemini model or a ModelRouter; route_hints (task, plan_length, duration,
+    prefix, cache_owner) are passed to the router. refresh=True skips a cached answer, for explicit
+    regenerate requests. Returns the response text, or None if the model returned no text.
+    """
+    prefix = route_hints.get("prefix")
+
+    def call_model():
+        if hasattr(model, "generate_text"):
+            # The router draws from the shared budget for each attempt itself
+            return model.generate_text(contents, **route_hints)
+        coordinator = get_coordinator()
+        if coordinator is not None:
+            coordinator.acquire("gemini")
+        request = contents if not prefix else [prefix] + ([contents] if isinstance(contents, str) else list(contents))
+        response = model.generate_content(request)
+        add_model_usage(response)
+        return response.text if response and getattr(response, "text", None) else None
+
+    coordinator = get_coordinator()
+    if coordinator is None:
+        return call_model()
+    key = generation_key(f"{getattr(model, 'model_name', model)}:{route_hints.get('task', '')}", [prefix, contents])
+    return coordinator.single_flight(key, call_model, ttl, refresh=refresh)
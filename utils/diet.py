@@ -3,16 +3,22 @@ import json
 import google.generativeai as genai
 import os
 from dotenv import load_dotenv
+from utils.nutrition import calculate_profile_targets, format_targets
+from utils.coordination import cached_generate
+from utils.router import get_router
 
 load_dotenv()
 
+# Lifetime of shared cached diet plans (seconds)
+DIET_CACHE_TTL = int(os.getenv("DIET_CACHE_TTL", "86400"))
+
 def get_gemini_model():
     """Initialize and return the Gemini model"""
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         raise ValueError("GEMINI_API_KEY not set in environment variables")
     genai.configure(api_key=api_key)
-    return genai.GenerativeModel('gemini-1.5-flash')
+    return get_router()
 
 def generate_diet_plan(user_profile, duration=7):
     """Generate a personalized diet plan based on user profile"""
@@ -28,6 +34,7 @@ def generate_diet_plan(user_profile, duration=7):
         height = user_profile.get('height', 170)
         injuries = user_profile.get('injuries', 'None')
         performance_goal = user_profile.get('performance_goal', '')
+        targets = format_targets(calculate_profile_targets(user_profile))
         
         prompt = f"""
 Create a comprehensive {duration}-day personalized diet plan for a {age}-year-old {experience} {sport} athlete.
@@ -47,9 +54,9 @@ Structure the response EXACTLY as follows:
 
 <div class='nutrition-principles'>
 <h4>Nutrition Principles</h4>
-<p><strong>Caloric Target:</strong> [Daily calorie range based on goals]</p>
-<p><strong>Macronutrient Ratio:</strong> [Protein/Carbs/Fats ratio]</p>
-<p><strong>Hydration Strategy:</strong> [Daily water intake and timing]</p>
+<p><strong>Caloric Target:</strong> {targets['caloric_target']}</p>
+<p><strong>Macronutrient Ratio:</strong> {targets['macro_ratio']}</p>
+<p><strong>Hydration Strategy:</strong> {targets['hydration']} - [timing around training]</p>
 <p><strong>Meal Timing:</strong> [When to eat around training]</p>
 </div>
 
@@ -98,6 +105,9 @@ Structure the response EXACTLY as follows:
 </div>
 </dietplan>
 
+The caloric target, macronutrient ratio and daily water intake above are pre-computed.
+Copy them exactly as given, do not recalculate them, and size every meal to fit them.
+
 Include:
 - Specific food items and portions
 - Nutritional information (calories, protein, carbs, fats)
@@ -106,17 +116,16 @@ Include:
 - Recipe ideas for key meals
 - Shopping list for the week
 - Supplement recommendations with scientific rationale
-- Hydration strategy
 
 Focus on foods that enhance performance in {sport} specifically.
 """
         
-        response = model.generate_content(prompt)
-        if not response or not getattr(response, "text", None):
+        response_text = cached_generate(model, prompt, ttl=DIET_CACHE_TTL, task="diet", duration=duration)
+        if not response_text:
             return None
             
         # Extract the plan content
-        response_text = response.text.strip()
+        response_text = response_text.strip()
         
         # Find the plan content between <dietplan> tags
         start = response_text.find('<dietplan>') + len('<dietplan>')
@@ -0,0 +1,242 @@
+# utils/knowledge.py
+import math
+import re
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+from utils.profiling import stage
+
+# Local reference library of drills, coaching cues and common mistakes per sport.
+# Prompts cite these entries by name instead of asking the model to invent them
+# on every call, which keeps technical content consistent and answers short.
+KNOWLEDGE_BASE = {
+    "General Fitness": [
+        ("drill", "Bodyweight Circuit", "Squats, push-ups, lunges and planks for 40s on / 20s off, 3-4 rounds to build work capacity."),
+        ("cue", "Brace Before You Move", "Exhale and tighten the trunk before every lift to protect the spine and transfer force."),
+        ("mistake", "Skipping the Warm-up", "Going straight into heavy work raises injury risk; use 5-10 min of mobility and ramp-up sets."),
+    ],
+    "Running": [
+        ("drill", "Strides", "6-8 x 100m relaxed accelerations to 90% speed with full walk-back recovery to groove efficient form."),
+        ("drill", "A-Skips", "Skip with high knee drive and active foot strike under the hips to train posture and cadence."),
+        ("cue", "Run Tall, Quick Feet", "Stay tall through the hips and aim for a cadence around 170-180 steps/min."),
+        ("mistake", "Overstriding", "Landing with the foot far ahead of the hips brakes every step; shorten stride and raise cadence."),
+    ],
+    "Cycling": [
+        ("drill", "Single-Leg Pedalling", "30-60s per leg at low resistance to smooth the pedal stroke and remove dead spots."),
+        ("drill", "High-Cadence Spin-ups", "Raise cadence gradually to 110-120 rpm without bouncing in the saddle."),
+        ("cue", "Quiet Upper Body", "Relax shoulders and grip; power comes from hips and legs, not rocking the bike."),
+        ("mistake", "Wrong Saddle Height", "A saddle too low overloads the knees; aim for a 25-35 degree knee bend at the bottom of the stroke."),
+    ],
+    "Swimming": [
+        ("drill", "Catch-up Freestyle", "One hand waits in front until the other arrives to lengthen the stroke and improve timing."),
+        ("drill", "Side Kick with Fins", "Kick on the side with the lower arm extended to train rotation and body line."),
+        ("cue", "Head Neutral, Hips High", "Look at the pool floor so the hips stay near the surface and drag drops."),
+        ("mistake", "Crossing Over", "Hands crossing the centre line at entry cause snaking; enter in line with the shoulder."),
+    ],
+    "Weight Training": [
+        ("drill", "Tempo Squats", "3-1-1 tempo with 60-70% load to own the bottom position and keep bar path vertical."),
+        ("drill", "Paused Bench Press", "1-2s pause on the chest to build starting strength and consistent touch point."),
+        ("cue", "Bar Over Mid-foot", "Keep the bar stacked over the middle of the foot throughout squats and pulls."),
+        ("mistake", "Ego Loading", "Adding weight before technique is stable; progress load only when all reps hit the target RPE."),
+    ],
+    "Basketball": [
+        ("drill", "Form Shooting", "One-hand shots from 1-2m, 10 makes per spot, to build a repeatable release."),
+        ("drill", "Two-Ball Dribbling", "Simultaneous and alternating dribbles to develop the weak hand and ball control."),
+        ("cue", "Elbow Under the Ball", "Align elbow, wrist and rim; finish with a relaxed gooseneck follow-through."),
+        ("mistake", "Ball Watching on Defence", "Focusing on the ball loses the man; keep vision on hips and split the floor."),
+    ],
+    "Soccer": [
+        ("drill", "Rondo 4v1", "Keep possession in a small grid with one- and two-touch passes to train scanning and angles."),
+        ("drill", "Wall Passes", "Alternate feet against a wall at pace to sharpen first touch and passing accuracy."),
+        ("cue", "Scan Before Receiving", "Check over the shoulder before the ball arrives so the first touch goes forward."),
+        ("mistake", "Flat-footed Receiving", "Receiving square and static invites pressure; open the body and stay on the toes."),
+    ],
+    "Tennis": [
+        ("drill", "Shadow Swings", "Slow-motion forehand/backhand swings focusing on unit turn and low-to-high path."),
+        ("drill", "Cross-court Rally", "Sustain cross-court rallies to a target zone to build consistency and margin."),
+        ("cue", "Split Step", "Time a small hop as the opponent strikes to load for the first move."),
+        ("mistake", "Arming the Ball", "Swinging with the arm only loses power; rotate hips and shoulders into the shot."),
+    ],
+    "Volleyball": [
+        ("drill", "Partner Passing", "Forearm passes to a partner or wall with a stable platform, 50 controlled contacts."),
+        ("drill", "Approach Footwork", "Repeat the 3-4 step approach without a ball to groove the penultimate step and arm swing."),
+        ("cue", "Platform to Target", "Angle the forearms toward the target and move the feet, not the arms."),
+        ("mistake", "Swinging on the Pass", "Swinging the arms at the ball sprays passes; keep the platform still and use the legs."),
+    ],
+    "Cricket": [
+        ("drill", "Throwdowns", "Short-distance throwdowns focusing on front-foot drive with head over the ball."),
+        ("drill", "Target Bowling", "Bowl at a cone on a good length, 6-ball overs, tracking hits per over."),
+        ("cue", "Head Still at Release", "Keep the head level and eyes on the ball through contact or delivery."),
+        ("mistake", "Falling Away", "Falling toward the off side at delivery costs accuracy; drive through toward the target."),
+    ],
+    "Baseball": [
+        ("drill", "Tee Work", "Hit off a tee at varied heights to build a short, direct bat path."),
+        ("drill", "Long Toss", "Progressive long toss to build arm strength with a smooth, loose throwing motion."),
+        ("cue", "Hips Before Hands", "Initiate the swing with hip rotation, then let the hands follow through the zone."),
+        ("mistake", "Casting the Hands", "Hands drifting away from the body create a long, slow swing; keep them inside the ball."),
+    ],
+    "American Football": [
+        ("drill", "Cone Cuts", "Plant-and-cut drills through cones to train change of direction at pace."),
+        ("drill", "Stance and Start", "Repeat explosive starts from a three-point stance over 5-10 yards."),
+        ("cue", "Low Man Wins", "Keep pad level low with hips sunk to win leverage at contact."),
+        ("mistake", "High Pad Level", "Standing up at contact gives away leverage and increases injury risk."),
+    ],
+    "Rugby": [
+        ("drill", "Tackle Technique Progression", "Kneeling to walking to jogging tackles on pads, cheek-to-cheek with head to the side."),
+        ("drill", "Passing Lanes", "Sprint lines passing at pace with hands up and early catch."),
+        ("cue", "Hands Up, Early Target", "Present hands as a target so the pass is caught in front of the body."),
+        ("mistake", "Head on Wrong Side", "Placing the head in front of the ball carrier risks neck injury; head behind, shoulder in."),
+    ],
+    "Badminton": [
+        ("drill", "Shadow Footwork", "Six-corner shadow movement with a racket, returning to base after each shot."),
+        ("drill", "Multi-shuttle Feeding", "Rapid feeds to one corner to groove a single stroke under fatigue."),
+        ("cue", "Racket Up", "Keep the racket head up between shots to shorten reaction time."),
+        ("mistake", "Flat-footed at Base", "Standing still at base slows the first step; stay light and split-step."),
+    ],
+    "Table Tennis": [
+        ("drill", "Forehand-Backhand Falkenberg", "One backhand, one forehand from backhand corner, one forehand from wide."),
+        ("drill", "Serve Practice", "Bucket of balls focusing on spin variation with the same motion."),
+        ("cue", "Use the Waist", "Rotate from the waist so strokes stay compact and powerful."),
+        ("mistake", "Standing Too Close", "Crowding the table cramps strokes; stand an arm's length back."),
+    ],
+    "Golf": [
+        ("drill", "Gate Putting", "Putt through two tees slightly wider than the ball to square the face at impact."),
+        ("drill", "Feet-together Swings", "Half swings with feet together to improve balance and tempo."),
+        ("cue", "Turn, Don't Sway", "Rotate around the spine in the backswing instead of sliding the hips."),
+        ("mistake", "Early Extension", "Hips thrusting toward the ball in the downswing cause blocks and hooks."),
+    ],
+    "Hockey": [
+        ("drill", "Indian Dribble", "Side-to-side stick dribble through cones keeping the ball close."),
+        ("drill", "Push Pass Pairs", "Push passes at 10-15m focusing on low, flat, accurate delivery."),
+        ("cue", "Low Body, Stick Down", "Stay low with the stick on the ground to control and intercept."),
+        ("mistake", "Upright Posture", "Standing tall loses control and reach; bend the knees, not just the back."),
+    ],
+    "Ice Hockey": [
+        ("drill", "Crossover Circles", "Continuous crossovers around face-off circles in both directions."),
+        ("drill", "Stickhandling Grid", "Quick hands through a pylon grid with head up."),
+        ("cue", "Full Stride Extension", "Push through to full leg extension and return the skate under the body."),
+        ("mistake", "Eyes on the Puck", "Staring at the puck hides the play; feel the puck and keep the head up."),
+    ],
+    "Boxing": [
+        ("drill", "Shadow Boxing Rounds", "3-min rounds focusing on stance, guard and combination flow."),
+        ("drill", "Slip Rope", "Move under a rope in slips and rolls to train head movement."),
+        ("cue", "Hands Home", "Return every punch straight back to the guard position."),
+        ("mistake", "Dropping the Guard", "Lowering the rear hand when jabbing leaves the chin exposed."),
+    ],
+    "Martial Arts": [
+        ("drill", "Kata/Forms Repetition", "Slow, precise repetitions of forms to refine balance and transitions."),
+        ("drill", "Pad Combinations", "Partner-held pads for kick-punch combinations at speed."),
+        ("cue", "Root Through the Floor", "Drive techniques from the ground up through the hips."),
+        ("mistake", "Telegraphing", "Winding up before striking gives away intent; strike from the stance."),
+    ],
+    "Skiing": [
+        ("drill", "Javelin Turns", "Lift the inside ski and cross it over to force balance on the outside ski."),
+        ("drill", "Pole Taps", "Rhythmic pole plants on a consistent slope to link turns."),
+        ("cue", "Shins Against Boots", "Keep pressure on the boot tongues to stay forward and in control."),
+        ("mistake", "Sitting Back", "Weight on the tails loses steering and overloads the quads."),
+    ],
+    "Snowboarding": [
+        ("drill", "Falling Leaf", "Traverse side to side on one edge to build edge control."),
+        ("drill", "Garlands", "Partial turns across the slope to practise initiation."),
+        ("cue", "Look Where You Turn", "Lead turns with the head and shoulders; the board follows."),
+        ("mistake", "Back Seat Riding", "Leaning uphill or back causes the board to wash out; stay centred."),
+    ],
+    "Surfing": [
+        ("drill", "Pop-up Reps", "Dry-land pop-ups from prone to stance, 20-30 fast, quiet reps."),
+        ("drill", "Paddle Intervals", "Sprint-paddle sets to build the power needed to catch waves."),
+        ("cue", "Eyes to the Shoulder", "Look down the line of the wave, not at the board."),
+        ("mistake", "Knee-first Pop-up", "Coming up to the knees first slows the pop-up; push straight to the feet."),
+    ],
+    "Rowing": [
+        ("drill", "Pick Drill", "Build the stroke from arms only, to arms and body, to full slide."),
+        ("drill", "Pause at Body-over", "Pause with arms straight and body pivoted to fix recovery sequence."),
+        ("cue", "Legs, Body, Arms", "Drive sequence legs-body-arms and recover arms-body-legs."),
+        ("mistake", "Shooting the Slide", "Legs driving before the back engages wastes power; connect through the core."),
+    ],
+    "Archery": [
+        ("drill", "Blank Bale Shooting", "Shoot at close range with eyes closed to refine form without aiming pressure."),
+        ("drill", "Form Strip", "Hold at full draw with a stretch band to build back tension."),
+        ("cue", "Back Tension Release", "Let the release come from continued back expansion, not finger movement."),
+        ("mistake", "Plucking the String", "Pulling the hand away at release throws the arrow sideways."),
+    ],
+    "Fencing": [
+        ("drill", "Footwork Ladders", "Advance-retreat-lunge sequences on call to build distance control."),
+        ("drill", "Target Lunges", "Lunge at a wall target focusing on arm extending before the foot."),
+        ("cue", "Hand Before Foot", "Extend the weapon arm before the front foot lands on the attack."),
+        ("mistake", "Over-lunging", "Lunges longer than recovery allows leave you open to the riposte."),
+    ],
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from how i in is it me my of on or the to with what when where why you your".split()
+)
+
+# Standard BM25 parameters
+_K1 = 1.5
+_B = 0.75
+
+
+def _tokenize(text):
+    return [t for t in _TOKEN_RE.findall(str(text).lower()) if t not in _STOPWORDS]
+
+
+@lru_cache(maxsize=1)
+def _build_index():
+    """Flatten the knowledge base and build an inverted index for BM25 scoring."""
+    entries = []
+    postings = defaultdict(dict)
+    lengths = []
+    for sport, items in KNOWLEDGE_BASE.items():
+        for kind, name, text in items:
+            doc_id = len(entries)
+            entries.append({"sport": sport, "kind": kind, "name": name, "text": text})
+            terms = Counter(_tokenize(f"{sport} {kind} {name} {text}"))
+            for term, tf in terms.items():
+                postings[term][doc_id] = tf
+            lengths.append(sum(terms.values()))
+    avg_len = sum(lengths) / len(lengths) if lengths else 0.0
+    return entries, dict(postings), lengths, avg_len
+
+
+@stage("knowledge.search")
+def search(query, sport=None, k=4):
+    """
+    Return up to k knowledge entries ranked by BM25 relevance to the query.
+    When a sport is given, only that sport's entries (plus General Fitness) are considered.
+    """
+    entries, postings, lengths, avg_len = _build_index()
+    allowed = {sport, "General Fitness"} if sport in KNOWLEDGE_BASE else None
+    n_docs = len(entries)
+
+    scores = defaultdict(float)
+    for term in set(_tokenize(query)):
+        docs = postings.get(term)
+        if not docs:
+            continue
+        idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+        for doc_id, tf in docs.items():
+            if allowed and entries[doc_id]["sport"] not in allowed:
+                continue
+            norm = tf + _K1 * (1 - _B + _B * lengths[doc_id] / avg_len)
+            scores[doc_id] += idf * tf * (_K1 + 1) / norm
+
+    ranked = sorted(scores, key=lambda d: (-scores[d], d))
+    results = [entries[d] for d in ranked[:k]]
+
+    # Top up with the sport's own entries so a plan always has drills, cues and mistakes to cite
+    if sport in KNOWLEDGE_BASE and len(results) < k:
+        for kind, name, text in KNOWLEDGE_BASE[sport]:
+            entry = {"sport": sport, "kind": kind, "name": name, "text": text}
+            if entry not in results:
+                results.append(entry)
+            if len(results) >= k:
+                break
+    return results
+
+
+def format_for_prompt(entries):
+    """Render retrieved entries as a compact reference block for a prompt."""
+    if not entries:
+        return "None"
+    return "\n".join(f"- [{e['kind'].title()}] {e['name']}: {e['text']}" for e in entries)
@@ -0,0 +1,120 @@
+# utils/nutrition.py
+import numpy as np
+import pandas as pd
+
+# Sport categories drive activity level and carbohydrate needs
+SPORT_CATEGORIES = {
+    "Running": "endurance", "Cycling": "endurance", "Swimming": "endurance",
+    "Rowing": "endurance", "Skiing": "endurance",
+    "Basketball": "team", "Soccer": "team", "Volleyball": "team", "Cricket": "team",
+    "Baseball": "team", "American Football": "team", "Rugby": "team", "Hockey": "team",
+    "Ice Hockey": "team", "Tennis": "team", "Badminton": "team",
+    "Weight Training": "strength", "Boxing": "strength", "Martial Arts": "strength",
+    "Snowboarding": "strength", "Surfing": "strength", "Fencing": "strength",
+    "Table Tennis": "skill", "Golf": "skill", "Archery": "skill",
+    "General Fitness": "general",
+}
+
+# Added physical activity level per training day, by category
+_PAL_PER_DAY = {"endurance": 0.10, "team": 0.085, "strength": 0.075, "general": 0.07, "skill": 0.05}
+# Carbohydrate target in g/kg body weight, by category
+_CARBS_G_PER_KG = {"endurance": 6.0, "team": 5.0, "strength": 4.0, "general": 4.0, "skill": 3.5}
+# Extra fluid per training session in ml, by category
+_SESSION_FLUID_ML = {"endurance": 1000, "team": 800, "strength": 600, "general": 500, "skill": 400}
+
+# Caloric adjustment and protein target (g/kg) per goal
+_GOAL_ENERGY = {"loss": 0.85, "gain": 1.10, "maintain": 1.0}
+_GOAL_PROTEIN = {"loss": 2.2, "gain": 2.0, "maintain": 1.6}
+
+# Whole words/phrases only, so e.g. "fatigue", "clean and jerk" or "play again" don't set a goal
+_LOSS_PATTERN = (r"\b(?:lose|losing|loss|cut|cutting|body fat|burn fat|lean out|get lean|leaner"
+                 r"|slim down|weight down|drop weight|shred|shredded)\b")
+_GAIN_PATTERN = r"\b(?:gain|gaining|muscle|muscles|bulk|bulking|mass|hypertrophy)\b"
+
+_DEFAULTS = {"age": 25, "weight": 70, "height": 170, "sport": "General Fitness",
+             "goals": "", "available_days": 3, "sex": ""}
+
+
+def _goal_category(goals: pd.Series) -> pd.Series:
+    text = goals.fillna("").astype(str).str.lower()
+    return pd.Series(
+        np.select(
+            [text.str.contains(_LOSS_PATTERN), text.str.contains(_GAIN_PATTERN)],
+            ["loss", "gain"],
+            default="maintain",
+        ),
+        index=goals.index,
+    )
+
+
+def calculate_targets(profiles: pd.DataFrame) -> pd.DataFrame:
+    """
+    Compute daily energy, macro and hydration targets for a roster of athletes.
+    Expects columns age, weight (kg), height (cm), sport, goals and available_days;
+    an optional sex column ('male'/'female') refines BMR. Missing values use defaults.
+    """
+    df = profiles.reindex(columns=list(_DEFAULTS)).copy()
+    for col, default in _DEFAULTS.items():
+        df[col] = df[col].fillna(default)
+    for col in ("age", "weight", "height", "available_days"):
+        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(_DEFAULTS[col])
+
+    category = df["sport"].map(SPORT_CATEGORIES).fillna("general")
+    goal = _goal_category(df["goals"])
+    sex = df["sex"].astype(str).str.lower()
+
+    # Mifflin-St Jeor; unknown sex uses the midpoint of the male/female offsets
+    sex_offset = np.select([sex == "male", sex == "female"], [5.0, -161.0], default=-78.0)
+    bmr = 10 * df["weight"] + 6.25 * df["height"] - 5 * df["age"] + sex_offset
+
+    days = df["available_days"].clip(0, 7)
+    pal = (1.2 + days * category.map(_PAL_PER_DAY)).clip(1.2, 2.2)
+    tdee = bmr * pal
+    calories = tdee * goal.map(_GOAL_ENERGY)
+
+    protein_g = df["weight"] * goal.map(_GOAL_PROTEIN)
+    fat_floor_g = df["weight"] * 0.8
+    carbs_g = df["weight"] * category.map(_CARBS_G_PER_KG)
+    # Carbs give way first when protein and minimum fat leave less energy than the category target
+    carbs_room_g = (calories - protein_g * 4 - fat_floor_g * 9) / 4
+    carbs_g = np.minimum(carbs_g, np.maximum(carbs_room_g, df["weight"] * 2.0))
+    fat_g = np.maximum((calories - protein_g * 4 - carbs_g * 4) / 9, fat_floor_g)
+    # Re-derive calories so the macros always add up to the stated target
+    calories = protein_g * 4 + carbs_g * 4 + fat_g * 9
+
+    hydration_l = (df["weight"] * 35 + days / 7 * category.map(_SESSION_FLUID_ML)) / 1000
+
+    result = pd.DataFrame({
+        "bmr": bmr.round(0),
+        "tdee": tdee.round(0),
+        "goal": goal,
+        "calories": calories.round(-1),
+        "calories_low": (calories * 0.95).round(-1),
+        "calories_high": (calories * 1.05).round(-1),
+        "protein_g": protein_g.round(0),
+        "carbs_g": carbs_g.round(0),
+        "fat_g": pd.Series(fat_g, index=df.index).round(0),
+        "hydration_l": hydration_l.round(1),
+    }, index=profiles.index)
+    result["protein_pct"] = (result["protein_g"] * 4 / calories * 100).round(0)
+    result["carbs_pct"] = (result["carbs_g"] * 4 / calories * 100).round(0)
+    result["fat_pct"] = 100 - result["protein_pct"] - result["carbs_pct"]
+    return result
+
+
+def calculate_profile_targets(user_profile: dict) -> dict:
+    """Convenience wrapper: targets for a single user profile as a plain dict."""
+    row = calculate_targets(pd.DataFrame([user_profile])).iloc[0]
+    return {k: (v.item() if hasattr(v, "item") else v) for k, v in row.items()}
+
+
+def format_targets(targets: dict) -> dict:
+    """Human-readable strings for the fixed values injected into the diet prompt."""
+    return {
+        "caloric_target": f"{targets['calories_low']:.0f}-{targets['calories_high']:.0f} kcal/day "
+                          f"(BMR {targets['bmr']:.0f}, TDEE {targets['tdee']:.0f}, goal: {targets['goal']})",
+        "macro_ratio": f"Protein {targets['protein_g']:.0f} g ({targets['protein_pct']:.0f}%) / "
+                       f"Carbs {targets['carbs_g']:.0f} g ({targets['carbs_pct']:.0f}%) / "
+                       f"Fats {targets['fat_g']:.0f} g ({targets['fat_pct']:.0f}%)",
+        "hydration": f"{targets['hydration_l']:.1f} L/day",
+    }
@@ -0,0 +1,116 @@
+# utils/plan_store.py
+import hashlib
+import zlib
+from datetime import datetime
+
+from google.api_core.exceptions import AlreadyExists
+
+from utils.profiling import stage
+
+# Plan bodies are stored once per distinct content, keyed by their SHA-256 hash.
+# Per-user documents in plans/{uid}/training_plans only hold metadata plus the hash,
+# so list views never download a plan body.
+PLAN_BODIES_COLLECTION = "plan_bodies"
+PLAN_ENCODING = "zlib"
+PLAN_METADATA_FIELDS = ["created_at", "duration", "focus", "size", "body_hash"]
+
+
+def plan_hash(plan_html: str) -> str:
+    return hashlib.sha256(plan_html.encode("utf-8")).hexdigest()
+
+
+def compress_plan(plan_html: str) -> bytes:
+    return zlib.compress(plan_html.encode("utf-8"), 9)
+
+
+def decompress_plan(data: bytes, encoding: str = PLAN_ENCODING) -> str:
+    if encoding != PLAN_ENCODING:
+        raise ValueError(f"Unsupported plan encoding: {encoding}")
+    return zlib.decompress(data).decode("utf-8")
+
+
+def _plans_collection(db, user_id: str):
+    return db.collection("plans").document(user_id).collection("training_plans")
+
+
+def save_plan_body(db, plan_html: str) -> str:
+    """Store a compressed plan body if it is not stored yet and return its hash."""
+    body_hash = plan_hash(plan_html)
+    try:
+        # create() fails instead of overwriting, so identical plans cost a single write attempt
+        db.collection(PLAN_BODIES_COLLECTION).document(body_hash).create({
+            "body": compress_plan(plan_html),
+            "encoding": PLAN_ENCODING,
+            "size": len(plan_html),
+            "created_at": datetime.now().isoformat(),
+        })
+    except AlreadyExists:
+        pass
+    return body_hash
+
+
+@stage("plan_store.save_plan")
+def save_plan(db, user_id: str, plan_html: str, duration: int, focus: str) -> dict:
+    """Save a plan body (deduplicated) plus a metadata document for the user. Returns the metadata."""
+    metadata = {
+        "body_hash": save_plan_body(db, plan_html),
+        "created_at": datetime.now().isoformat(),
+        "duration": duration,
+        "focus": focus,
+        "size": len(plan_html),
+    }
+    _, ref = _plans_collection(db, user_id).add(metadata)
+    return {"id": ref.id, **metadata}
+
+
+@stage("plan_store.load_plan_body")
+def load_plan_body(db, body_hash: str):
+    """Fetch and decompress a plan body by hash. Returns None if it does not exist."""
+    doc = db.collection(PLAN_BODIES_COLLECTION).document(body_hash).get()
+    if not doc.exists:
+        return None
+    data = doc.to_dict()
+    return decompress_plan(data["body"], data.get("encoding", PLAN_ENCODING))
+
+
+def load_plan(db, plan_doc: dict):
+    """Resolve the body of a plan metadata document, including legacy documents with an inline 'plan' field."""
+    if plan_doc.get("body_hash"):
+        return load_plan_body(db, plan_doc["body_hash"])
+    return plan_doc.get("plan")
+
+
+def plans_page_query(db, user_id: str, page_size: int = 20, start_after=None):
+    """Query for one page of plan metadata, newest first; works with the sync and async clients."""
+    query = (
+        _plans_collection(db, user_id)
+        .select(PLAN_METADATA_FIELDS)
+        .order_by("created_at", direction="DESCENDING")
+        .limit(page_size)
+    )
+    if start_after is not None:
+        query = query.start_after(start_after)
+    return query
+
+
+def plans_page(snapshots, page_size: int):
+    """Turn a page of snapshots into (items, cursor); the cursor is None on the last page."""
+    items = [{"id": snap.id, **snap.to_dict()} for snap in snapshots]
+    cursor = snapshots[-1] if len(snapshots) == page_size else None
+    return items, cursor
+
+
+@stage("plan_store.list_plans")
+def list_plans(db, user_id: str, page_size: int = 20, start_after=None):
+    """
+    List a page of plan metadata, newest first, without downloading plan bodies.
+    Pass the returned cursor back as start_after to fetch the next page; it is None on the last page.
+    """
+    snapshots = list(plans_page_query(db, user_id, page_size, start_after).stream())
+    return plans_page(snapshots, page_size)
+
+
+def load_plan_by_id(db, user_id: str, plan_id: str):
+    """Resolve a plan body from its metadata document id."""
+    doc = _plans_collection(db, user_id).document(plan_id).get()
+    return load_plan(db, doc.to_dict()) if doc.exists else None
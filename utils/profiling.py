@@ -0,0 +1,209 @@
+# utils/profiling.py
+import contextvars
+import cProfile
+import csv
+import io
+import json
+import os
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Every Streamlit rerun executes app.main top to bottom. Named stages are timed on each rerun
+# and folded into per-process histograms, so slow stages and regressions show up without
+# attaching a profiler. PROFILE_SAMPLE_RATE (0-1) additionally runs cProfile on that fraction
+# of reruns; PROFILE_OVERLAY=1 shows the developer overlay in the sidebar.
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_OVERLAY = os.getenv("PROFILE_OVERLAY", "0") == "1"
+
+# Histogram bucket upper bounds in milliseconds; the last bucket is open-ended
+HISTOGRAM_BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+# Recent samples kept per stage for percentiles, and recent reruns/profiles kept for the overlay
+_RECENT_SAMPLES = 500
+_RECENT_RERUNS = 50
+_RECENT_PROFILES = 10
+_PROFILE_TOP_FUNCTIONS = 30
+
+_current_rerun = contextvars.ContextVar("profiling_rerun", default=None)
+_lock = threading.Lock()
+_stats = {}
+_reruns = deque(maxlen=_RECENT_RERUNS)
+_profiles = deque(maxlen=_RECENT_PROFILES)
+# Python allows one cProfile per thread at a time (and one per process on 3.12+)
+_profiler_lock = threading.Lock()
+
+
+class StageStats:
+    """Cumulative timing histogram for one stage."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        self.recent = deque(maxlen=_RECENT_SAMPLES)
+
+    def add(self, ms):
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        index = next((i for i, bound in enumerate(HISTOGRAM_BOUNDS_MS) if ms <= bound), len(HISTOGRAM_BOUNDS_MS))
+        self.buckets[index] += 1
+        self.recent.append(ms)
+
+    def percentile(self, q):
+        samples = sorted(self.recent)
+        return samples[min(len(samples) - 1, int(q * len(samples)))] if samples else 0.0
+
+
+class RerunProfile:
+    """Stage timings of one script rerun, in completion order."""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.stages = []    # (name, ms, depth)
+        self.depth = 0
+        self.total_ms = 0.0
+        self.profiled = False
+
+
+def _record(name, ms):
+    with _lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = StageStats()
+        stats.add(ms)
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a named stage of the current rerun. Works as a context manager or a decorator:
+
+        with stage("render_chat_log"): ...
+        @stage("plan_store.list_plans")
+        def list_plans(...): ...
+    """
+    rerun = _current_rerun.get()
+    if rerun is not None:
+        rerun.depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - started) * 1000
+        _record(name, ms)
+        if rerun is not None:
+            rerun.depth -= 1
+            rerun.stages.append((name, ms, rerun.depth))
+
+
+@contextmanager
+def profile_rerun(sample_rate=None):
+    """Collect the stages of one rerun, running cProfile on a sampled fraction of reruns."""
+    rerun = RerunProfile()
+    token = _current_rerun.set(rerun)
+    rate = PROFILE_SAMPLE_RATE if sample_rate is None else sample_rate
+    profiler = None
+    if rate > 0 and random.random() < rate and _profiler_lock.acquire(blocking=False):
+        try:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            rerun.profiled = True
+        except ValueError:
+            # Another profiler is already active in this process
+            profiler = None
+            _profiler_lock.release()
+    started = time.perf_counter()
+    try:
+        yield rerun
+    finally:
+        rerun.total_ms = (time.perf_counter() - started) * 1000
+        if profiler is not None:
+            profiler.disable()
+            _profiler_lock.release()
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(_PROFILE_TOP_FUNCTIONS)
+            with _lock:
+                _profiles.append({"started_at": rerun.started_at, "total_ms": rerun.total_ms,
+                                  "stats": out.getvalue()})
+        _current_rerun.reset(token)
+        _record("rerun", rerun.total_ms)
+        with _lock:
+            _reruns.append(rerun)
+
+
+def current_rerun():
+    return _current_rerun.get()
+
+
+def recent_reruns():
+    """The most recent finished reruns in this process, oldest first."""
+    with _lock:
+        return list(_reruns)
+
+
+def slowest_stages(limit=10):
+    """Per-stage summary (count, mean, p50, p95, max in ms), slowest p95 first."""
+    with _lock:
+        rows = [
+            {
+                "stage": name,
+                "count": s.count,
+                "mean_ms": s.total_ms / s.count,
+                "p50_ms": s.percentile(0.5),
+                "p95_ms": s.percentile(0.95),
+                "max_ms": s.max_ms,
+            }
+            for name, s in _stats.items()
+        ]
+    rows.sort(key=lambda row: -row["p95_ms"])
+    return rows[:limit]
+
+
+def recent_profiles():
+    with _lock:
+        return list(_profiles)
+
+
+def histogram_rows():
+    """One row per stage and bucket: {"stage", "le_ms", "count"}; le_ms is None for the open-ended bucket."""
+    bounds = HISTOGRAM_BOUNDS_MS + [None]
+    with _lock:
+        return [
+            {"stage": name, "le_ms": bound, "count": count}
+            for name, s in sorted(_stats.items())
+            for bound, count in zip(bounds, s.buckets)
+        ]
+
+
+def export_histograms_csv():
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=["stage", "le_ms", "count"])
+    writer.writeheader()
+    writer.writerows(histogram_rows())
+    return out.getvalue()
+
+
+def export_histograms_json():
+    with _lock:
+        payload = {
+            "exported_at": time.time(),
+            "bounds_ms": HISTOGRAM_BOUNDS_MS,
+            "stages": {
+                name: {"count": s.count, "total_ms": s.total_ms, "max_ms": s.max_ms, "buckets": s.buckets}
+                for name, s in sorted(_stats.items())
+            },
+        }
+    return json.dumps(payload, indent=2)
+
+
+def reset():
+    """Clear all collected timings and profiles (e.g. before a benchmark run)."""
+    with _lock:
+        _stats.clear()
+        _reruns.clear()
+        _profiles.clear()
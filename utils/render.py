@@ -0,0 +1,174 @@
+# utils/render.py
+import html
+import os
+import re
+import threading
+from collections import OrderedDict, namedtuple
+from html.parser import HTMLParser
+
+from utils.profiling import stage
+
+# Model output is sanitized against an allowlist before it is ever sent to a browser.
+# Only structural/text tags survive, and only the class attribute (used by the plan layout).
+ALLOWED_TAGS = frozenset({
+    "div", "span", "p", "br", "hr", "h1", "h2", "h3", "h4", "h5", "h6",
+    "strong", "b", "em", "i", "u", "small", "sub", "sup", "code", "pre", "blockquote",
+    "ul", "ol", "li", "table", "thead", "tbody", "tr", "th", "td",
+})
+ALLOWED_ATTRS = frozenset({"class"})
+VOID_TAGS = frozenset({"br", "hr"})
+# Whitespace-only text between two of these tags is layout noise and is dropped
+BLOCK_TAGS = frozenset({
+    "div", "p", "hr", "h1", "h2", "h3", "h4", "h5", "h6", "pre", "blockquote",
+    "ul", "ol", "li", "table", "thead", "tbody", "tr", "th", "td",
+})
+# Tags whose content is dropped together with the tag
+DROP_CONTENT_TAGS = frozenset({"script", "style", "iframe", "object", "embed", "noscript", "template", "svg", "math"})
+
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "128"))
+
+RenderedPlan = namedtuple("RenderedPlan", ["html", "download"])
+
+_CODE_FENCE_RE = re.compile(r"^```[a-zA-Z]*\s*|\s*```$")
+# Runs of spaces/tabs, except indentation after a newline; newlines are kept for markdown
+_WHITESPACE_RE = re.compile(r"(?:^|(?<=\S))[^\S\n]+")
+_CLASS_RE = re.compile(r"[^A-Za-z0-9_\- ]")
+
+_DOWNLOAD_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: -apple-system, "Segoe UI", Roboto, sans-serif; max-width: 960px; margin: 2rem auto; padding: 0 1rem; line-height: 1.5; }}
+h2, h3, h4, h5 {{ margin-top: 1.5rem; }}
+</style>
+</head>
+<body>
+{body}
+</body>
+</html>
+"""
+
+
+class _Sanitizer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self.open_tags = []
+        self.drop_depth = 0
+        self.pre_depth = 0
+        # Whitespace-only text waiting to see whether the next tag is block-level
+        self.pending_space = ""
+        self.after_block = True
+
+    def _emit_tag(self, tag, markup):
+        if self.pending_space and not (self.after_block and tag in BLOCK_TAGS):
+            self.out.append(self.pending_space)
+        self.pending_space = ""
+        self.out.append(markup)
+        self.after_block = tag in BLOCK_TAGS
+        if tag == "pre":
+            self.pre_depth += 1 if not markup.startswith("</") else -1
+
+    def _emit_text(self, text):
+        self.out.append(self.pending_space + html.escape(text, quote=False))
+        self.pending_space = ""
+        self.after_block = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROP_CONTENT_TAGS:
+            self.drop_depth += 1
+            return
+        if self.drop_depth or tag not in ALLOWED_TAGS:
+            return
+        kept = "".join(
+            f' {name}="{_CLASS_RE.sub("", value)}"'
+            for name, value in attrs
+            if name in ALLOWED_ATTRS and value
+        )
+        self._emit_tag(tag, f"<{tag}{kept}>")
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag in DROP_CONTENT_TAGS:
+            self.drop_depth -= 1
+
+    def handle_endtag(self, tag):
+        if tag in DROP_CONTENT_TAGS:
+            self.drop_depth = max(0, self.drop_depth - 1)
+            return
+        if self.drop_depth or tag not in self.open_tags:
+            return
+        # Close any tags left open inside this one so the output stays well-formed
+        while self.open_tags:
+            open_tag = self.open_tags.pop()
+            self._emit_tag(open_tag, f"</{open_tag}>")
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if self.drop_depth:
+            return
+        if self.pre_depth:
+            self._emit_text(data)
+        elif data.isspace():
+            self.pending_space += data
+        else:
+            self._emit_text(_WHITESPACE_RE.sub(" ", data))
+
+    def result(self):
+        self.close()
+        for tag in reversed(self.open_tags):
+            self._emit_tag(tag, f"</{tag}>")
+        self.open_tags = []
+        return "".join(self.out)
+
+
+@stage("render.sanitize_plan_html")
+def sanitize_plan_html(raw_html: str) -> str:
+    """
+    Strip code fences and disallowed tags/attributes from model HTML, and drop whitespace that
+    carries no meaning (between block tags, repeated spaces). <pre> content and newlines are kept.
+    """
+    if not raw_html:
+        return ""
+    sanitizer = _Sanitizer()
+    sanitizer.feed(_CODE_FENCE_RE.sub("", raw_html.strip()))
+    return sanitizer.result().strip()
+
+
+def build_download(plan_html: str, title: str = "Training Plan") -> bytes:
+    return _DOWNLOAD_TEMPLATE.format(title=html.escape(title), body=plan_html).encode("utf-8")
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+@stage("render.get_rendered_plan")
+def get_rendered_plan(plan_ref: str, load_html, title: str = "Training Plan"):
+    """
+    Return the sanitized HTML and download bytes for a plan, building them at most once per plan hash.
+    load_html is only called on a cache miss and should return the stored plan body (or None).
+    """
+    key = (plan_ref, title)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    raw_html = load_html()
+    if not raw_html:
+        return None
+    # Sanitizing is idempotent, so bodies saved before sanitization was introduced are handled too
+    clean_html = sanitize_plan_html(raw_html)
+    rendered = RenderedPlan(html=clean_html, download=build_download(clean_html, title))
+
+    with _cache_lock:
+        _cache[key] = rendered
+        while len(_cache) > RENDER_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return rendered
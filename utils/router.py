@@ -0,0 +1,175 @@
+# utils/router.py
+import os
+import threading
+import time
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+from utils.context_cache import get_prefix_cache
+from utils.coordination import get_coordinator
+from utils.usage import add_model_usage
+
+# Model tiers from fastest/cheapest to strongest. Each request is routed to one tier and
+# falls back to the others on timeouts or transient errors.
+TIER_ORDER = ["fast", "standard", "strong"]
+TIER_MODELS = {
+    "fast": os.getenv("GEMINI_MODEL_FAST", "gemini-1.5-flash-8b"),
+    "standard": os.getenv("GEMINI_MODEL_STANDARD", "gemini-1.5-flash"),
+    "strong": os.getenv("GEMINI_MODEL_STRONG", "gemini-1.5-pro"),
+}
+TIER_TIMEOUTS = {"fast": 20, "standard": 60, "strong": 120}
+
+# Latency budget per task (seconds); a tier whose recent latency exceeds it is stepped down
+TASK_LATENCY_BUDGET = {"chat": 10, "plan": 90, "diet": 90}
+# Prompts above this size skip the fast tier
+LARGE_PROMPT_CHARS = 6000
+# Weight of the newest observation in the moving latency average
+_LATENCY_ALPHA = 0.3
+# A latency average older than this is forgotten, so a demoted tier gets probed again
+LATENCY_MEMORY_SECONDS = float(os.getenv("ROUTER_LATENCY_MEMORY", "300"))
+# After a timeout or transient error a tier is skipped for this long (failures don't enter the average)
+FAILURE_COOLDOWN_SECONDS = float(os.getenv("ROUTER_FAILURE_COOLDOWN", "60"))
+
+_RETRYABLE = (
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.InternalServerError,
+    TimeoutError,
+)
+
+
+class ModelRouter:
+    """Chooses a Gemini model tier per request and falls back across tiers on timeouts."""
+
+    model_name = "router"
+
+    def __init__(self):
+        self._models = {}
+        self._latency = {}    # tier -> (moving average of successful calls, last update time)
+        self._failed_at = {}  # tier -> time of the last timeout/transient error
+        self._lock = threading.Lock()
+
+    def _model(self, tier):
+        with self._lock:
+            if tier not in self._models:
+                self._models[tier] = genai.GenerativeModel(TIER_MODELS[tier])
+            return self._models[tier]
+
+    def observed_latency(self, tier):
+        """Recent latency of successful calls on a tier, or None if there is no recent observation."""
+        with self._lock:
+            entry = self._latency.get(tier)
+        if entry is None or time.time() - entry[1] > LATENCY_MEMORY_SECONDS:
+            return None
+        return entry[0]
+
+    def recently_failed(self, tier):
+        with self._lock:
+            failed_at = self._failed_at.get(tier)
+        return failed_at is not None and time.time() - failed_at < FAILURE_COOLDOWN_SECONDS
+
+    def _observe(self, tier, seconds):
+        previous = self.observed_latency(tier)
+        with self._lock:
+            average = seconds if previous is None else _LATENCY_ALPHA * seconds + (1 - _LATENCY_ALPHA) * previous
+            self._latency[tier] = (average, time.time())
+
+    def _observe_failure(self, tier):
+        with self._lock:
+            self._failed_at[tier] = time.time()
+
+    def choose_tier(self, task, prompt_chars, plan_length=None, duration=None):
+        """Pick a tier from task type, prompt size, requested plan detail and recent latency."""
+        plan_length = (plan_length or "medium").lower()
+        if task == "chat":
+            tier = "fast" if prompt_chars < LARGE_PROMPT_CHARS else "standard"
+        elif task == "plan" and (plan_length == "detailed" or (duration or 0) >= 8):
+            tier = "strong"
+        elif task == "plan" and plan_length == "short" and (duration or 4) <= 4:
+            tier = "fast" if prompt_chars < LARGE_PROMPT_CHARS else "standard"
+        else:
+            tier = "standard"
+
+        # Step down while the chosen tier is currently slower than the task's budget or just failed.
+        # Both signals expire, so a demoted tier is tried again once they are stale.
+        budget = TASK_LATENCY_BUDGET.get(task)
+        while TIER_ORDER.index(tier) > 0:
+            latency = self.observed_latency(tier)
+            too_slow = budget and latency is not None and latency > budget
+            if not too_slow and not self.recently_failed(tier):
+                break
+            tier = TIER_ORDER[TIER_ORDER.index(tier) - 1]
+        return tier
+
+    def fallback_order(self, tier):
+        """The chosen tier first, then faster tiers (nearest first), then stronger ones."""
+        index = TIER_ORDER.index(tier)
+        return [tier] + TIER_ORDER[:index][::-1] + TIER_ORDER[index + 1:]
+
+    def generate_text(self, contents, task="chat", plan_length=None, duration=None, prefix=None, cache_owner=None):
+        """
+        Generate text for a request, recording the routing decision and outcome of every attempt.
+        A stable prefix is served from the tier model's context cache when possible, otherwise sent inline.
+        """
+        contents = [contents] if isinstance(contents, str) else list(contents)
+        prompt_chars = sum(len(str(c)) for c in contents) + len(prefix or "")
+        chosen = self.choose_tier(task, prompt_chars, plan_length, duration)
+        coordinator = get_coordinator()
+        prefix_cache = get_prefix_cache() if prefix else None
+        last_error = None
+
+        for tier in self.fallback_order(chosen):
+            if coordinator is not None:
+                coordinator.acquire("gemini")
+            model, request = self._model(tier), contents
+            if prefix:
+                cached_model = prefix_cache.model_for(TIER_MODELS[tier], prefix, cache_owner) if prefix_cache else None
+                if cached_model is not None:
+                    model = cached_model
+                else:
+                    request = [prefix] + contents
+            started = time.time()
+            try:
+                try:
+                    response = model.generate_content(
+                        request, request_options={"timeout": TIER_TIMEOUTS[tier]}
+                    )
+                except google_exceptions.NotFound:
+                    if not prefix or request is not contents:
+                        raise
+                    # The cached prefix expired or was deleted elsewhere; resend it inline on this tier
+                    prefix_cache.invalidate(TIER_MODELS[tier], prefix)
+                    response = self._model(tier).generate_content(
+                        [prefix] + contents, request_options={"timeout": TIER_TIMEOUTS[tier]}
+                    )
+                outcome = "ok"
+            except _RETRYABLE as e:
+                response, outcome, last_error = None, type(e).__name__, e
+            elapsed = time.time() - started
+            if outcome == "ok":
+                self._observe(tier, elapsed)
+            else:
+                self._observe_failure(tier)
+            if coordinator is not None:
+                coordinator.record_routing(task, tier, TIER_MODELS[tier], chosen, prompt_chars, elapsed, outcome)
+            if outcome == "ok":
+                add_model_usage(response)
+                return response.text if response and getattr(response, "text", None) else None
+
+        raise last_error
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """Returns the process-wide router, so observed latency and failures carry across reruns and callers."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ModelRouter()
+    return _router
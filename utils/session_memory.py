@@ -0,0 +1,98 @@
+# utils/session_memory.py
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+from utils.plan_store import plan_hash
+from utils.profiling import stage
+
+try:
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+except ImportError:  # older Streamlit releases
+    from streamlit.scriptrunner import get_script_run_ctx
+
+# Chat history is a ring buffer: older turns are already persisted by the storage layer
+CHAT_HISTORY_MAX_MESSAGES = int(os.getenv("CHAT_HISTORY_MAX_MESSAGES", "200"))
+# Plan bodies kept in memory per session; evicted ones are re-read from storage by hash
+SESSION_PLAN_CACHE_SIZE = int(os.getenv("SESSION_PLAN_CACHE_SIZE", "3"))
+# Sessions that have not rerun for this long are dropped from the accounting table
+SESSION_STALE_SECONDS = int(os.getenv("SESSION_STALE_SECONDS", "3600"))
+
+_usage = {}
+_usage_lock = threading.Lock()
+
+
+def new_chat_history(messages=()):
+    return deque(messages, maxlen=CHAT_HISTORY_MAX_MESSAGES)
+
+
+def remember_plan(session_state, plan_html: str, plan_ref: str = None) -> str:
+    """Keep a plan body once in the session, keyed by its content hash, and return the reference."""
+    plan_ref = plan_ref or plan_hash(plan_html)
+    blobs = session_state.setdefault("plan_blobs", OrderedDict())
+    blobs[plan_ref] = plan_html
+    blobs.move_to_end(plan_ref)
+    while len(blobs) > SESSION_PLAN_CACHE_SIZE:
+        blobs.popitem(last=False)
+    return plan_ref
+
+
+def resolve_plan(session_state, plan_ref: str, store=None):
+    """Return the plan body for a reference, reloading spilled bodies from storage."""
+    if not plan_ref:
+        return None
+    blobs = session_state.setdefault("plan_blobs", OrderedDict())
+    if plan_ref in blobs:
+        blobs.move_to_end(plan_ref)
+        return blobs[plan_ref]
+    if store is None:
+        return None
+    plan_html = store.load_plan_body(plan_ref)
+    if plan_html:
+        remember_plan(session_state, plan_html, plan_ref)
+    return plan_html
+
+
+def estimate_size(obj, _seen=None) -> int:
+    """Approximate deep size of an object in bytes."""
+    _seen = _seen if _seen is not None else set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, _seen) + estimate_size(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(estimate_size(item, _seen) for item in obj)
+    return size
+
+
+@stage("session_memory.record_session_usage")
+def record_session_usage(session_state, user_id=None):
+    """Update the process-wide memory accounting entry for the current session."""
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return
+    keys = {key: estimate_size(session_state[key]) for key in list(session_state.keys())}
+    now = time.time()
+    with _usage_lock:
+        _usage[ctx.session_id] = {
+            "session_id": ctx.session_id,
+            "user": user_id,
+            "bytes": sum(keys.values()),
+            "largest_key": max(keys, key=keys.get) if keys else None,
+            "chat_messages": len(session_state.get("chat_history", ())),
+            "cached_plans": len(session_state.get("plan_blobs", ())),
+            "updated_at": now,
+        }
+        for session_id in [s for s, u in _usage.items() if now - u["updated_at"] > SESSION_STALE_SECONDS]:
+            del _usage[session_id]
+
+
+def top_sessions(limit: int = 10):
+    """Sessions in this process ordered by estimated memory use, largest first."""
+    with _usage_lock:
+        rows = sorted(_usage.values(), key=lambda u: u["bytes"], reverse=True)
+    return [dict(row) for row in rows[:limit]]
@@ -0,0 +1,317 @@
+# utils/sqlite_store.py
+import hashlib
+import hmac
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from utils.analytics import empty_stats, finish_stats
+from utils.plan_store import PLAN_ENCODING, compress_plan, decompress_plan, plan_hash
+from utils.storage import AccountExistsError, AccountNotFoundError, StorageBackend
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    uid TEXT PRIMARY KEY,
+    email TEXT NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
+    display_name TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (
+    uid TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS plan_bodies (
+    hash TEXT PRIMARY KEY,
+    body BLOB NOT NULL,
+    encoding TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS plans (
+    id TEXT PRIMARY KEY,
+    uid TEXT NOT NULL,
+    body_hash TEXT NOT NULL REFERENCES plan_bodies (hash),
+    created_at TEXT NOT NULL,
+    duration INTEGER,
+    focus TEXT,
+    size INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_plans_uid_created ON plans (uid, created_at);
+CREATE TABLE IF NOT EXISTS chats (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    uid TEXT NOT NULL,
+    message TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    plan_ref TEXT,
+    sport TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_chats_uid_created ON chats (uid, created_at);
+CREATE TABLE IF NOT EXISTS usage_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    uid TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    input_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_usage_uid_created ON usage_events (uid, created_at);
+"""
+
+# Columns added after the first release: (table, column, type). Applied to existing databases on open.
+_ADDED_COLUMNS = [
+    ("chats", "plan_ref", "TEXT"),
+    ("chats", "sport", "TEXT"),
+]
+
+_PBKDF2_ITERATIONS = 200_000
+
+
+def _hash_password(password: str, salt: bytes = None) -> str:
+    salt = salt or os.urandom(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, _PBKDF2_ITERATIONS)
+    return f"{salt.hex()}${digest.hex()}"
+
+
+def _verify_password(password: str, stored: str) -> bool:
+    salt_hex, _ = stored.split("$", 1)
+    return hmac.compare_digest(_hash_password(password, bytes.fromhex(salt_hex)), stored)
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    Embedded storage on a local SQLite file, for single-node and edge deployments and tests.
+    Runs in WAL mode so readers never block the writer; each thread gets its own connection.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = "minigpt_coach.db"):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+        for table, column, column_type in _ADDED_COLUMNS:
+            existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: transactions are managed explicitly in _transaction()
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+            self._local.depth = 0
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        if self._local.depth:
+            # Already inside batch(); the outer transaction commits
+            self._local.depth += 1
+            try:
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+        self._local.depth = 1
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            self._local.depth = 0
+
+    @contextmanager
+    def batch(self):
+        with self._transaction():
+            yield self
+
+    # Accounts
+    def create_account(self, email, password, display_name):
+        if not email or "@" not in email:
+            raise ValueError("Invalid email address")
+        if not password or len(password) < 6:
+            raise ValueError("Password must be at least 6 characters long")
+        uid = uuid.uuid4().hex
+        try:
+            with self._transaction() as conn:
+                conn.execute(
+                    "INSERT INTO accounts (uid, email, password_hash, display_name, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (uid, email.strip().lower(), _hash_password(password), display_name, datetime.now().isoformat()),
+                )
+        except sqlite3.IntegrityError as e:
+            raise AccountExistsError(email) from e
+        return uid
+
+    def authenticate(self, email, password):
+        row = self._connect().execute(
+            "SELECT uid, password_hash FROM accounts WHERE email = ?", (email.strip().lower(),)
+        ).fetchone()
+        if row is None or not _verify_password(password, row["password_hash"]):
+            raise AccountNotFoundError(email)
+        return row["uid"]
+
+    # User profiles
+    def get_user(self, user_id):
+        row = self._connect().execute("SELECT data FROM users WHERE uid = ?", (user_id,)).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def set_user(self, user_id, user_data, merge=True):
+        with self._transaction() as conn:
+            data = dict(user_data)
+            if merge:
+                row = conn.execute("SELECT data FROM users WHERE uid = ?", (user_id,)).fetchone()
+                if row:
+                    data = {**json.loads(row["data"]), **user_data}
+            conn.execute(
+                "INSERT INTO users (uid, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (uid) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                (user_id, json.dumps(data, default=str), datetime.now().isoformat()),
+            )
+
+    # Plans
+    def save_plan(self, user_id, plan_html, duration, focus):
+        now = datetime.now().isoformat()
+        metadata = {
+            "body_hash": plan_hash(plan_html),
+            "created_at": now,
+            "duration": duration,
+            "focus": focus,
+            "size": len(plan_html),
+        }
+        plan_id = uuid.uuid4().hex
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO plan_bodies (hash, body, encoding, size, created_at) VALUES (?, ?, ?, ?, ?)",
+                (metadata["body_hash"], compress_plan(plan_html), PLAN_ENCODING, len(plan_html), now),
+            )
+            conn.execute(
+                "INSERT INTO plans (id, uid, body_hash, created_at, duration, focus, size) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (plan_id, user_id, metadata["body_hash"], now, duration, focus, metadata["size"]),
+            )
+        return {"id": plan_id, **metadata}
+
+    def list_plans(self, user_id, page_size=20, start_after=None):
+        # The cursor is the (created_at, id) pair of the last row of the previous page
+        query = "SELECT id, created_at, duration, focus, size, body_hash FROM plans WHERE uid = ?"
+        params = [user_id]
+        if start_after is not None:
+            query += " AND (created_at < ? OR (created_at = ? AND id < ?))"
+            params += [start_after[0], start_after[0], start_after[1]]
+        query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(page_size)
+        items = [dict(row) for row in self._connect().execute(query, params)]
+        cursor = (items[-1]["created_at"], items[-1]["id"]) if len(items) == page_size else None
+        return items, cursor
+
+    def load_plan_body(self, body_hash):
+        row = self._connect().execute(
+            "SELECT body, encoding FROM plan_bodies WHERE hash = ?", (body_hash,)
+        ).fetchone()
+        return decompress_plan(row["body"], row["encoding"]) if row else None
+
+    def load_plan_by_id(self, user_id, plan_id):
+        row = self._connect().execute(
+            "SELECT body_hash FROM plans WHERE uid = ? AND id = ?", (user_id, plan_id)
+        ).fetchone()
+        return self.load_plan_body(row["body_hash"]) if row else None
+
+    # Chats
+    def append_chat_turn(self, user_id, message, response, sport=None, plan_ref=None):
+        self.append_chat_turns(user_id, [(message, response, sport, plan_ref)])
+
+    def append_chat_turns(self, user_id, turns):
+        """Insert several (message, response, sport, plan_ref) turns in one transaction."""
+        now = datetime.now().isoformat()
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT INTO chats (uid, message, response, created_at, sport, plan_ref) VALUES (?, ?, ?, ?, ?, ?)",
+                [(user_id, message, response, now, sport, plan_ref) for message, response, sport, plan_ref in turns],
+            )
+
+    def load_recent_turns(self, user_id, limit=200):
+        rows = self._connect().execute(
+            "SELECT message, response, created_at AS timestamp, plan_ref FROM chats "
+            "WHERE uid = ? ORDER BY created_at DESC, id DESC LIMIT ?",
+            (user_id, limit),
+        ).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+    # Usage accounting
+    def record_usage(self, user_id, kind, input_tokens, output_tokens, seconds):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO usage_events (uid, kind, input_tokens, output_tokens, seconds, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, kind, input_tokens, output_tokens, seconds, datetime.now().isoformat()),
+            )
+
+    def usage_window(self, user_id, since, kind):
+        row = self._connect().execute(
+            "SELECT COALESCE(SUM(kind = ?), 0) AS requests, COALESCE(SUM(input_tokens + output_tokens), 0) AS tokens "
+            "FROM usage_events WHERE uid = ? AND created_at >= ?",
+            (kind, user_id, since),
+        ).fetchone()
+        return dict(row)
+
+    def oldest_usage_since(self, user_id, since, kind=None):
+        query = "SELECT MIN(created_at) FROM usage_events WHERE uid = ? AND created_at >= ?"
+        params = [user_id, since]
+        if kind:
+            query += " AND kind = ?"
+            params.append(kind)
+        return self._connect().execute(query, params).fetchone()[0]
+
+    def top_usage(self, limit=10):
+        rows = self._connect().execute(
+            "SELECT uid, COUNT(*) AS requests, SUM(input_tokens) AS input_tokens, "
+            "SUM(output_tokens) AS output_tokens, SUM(seconds) AS seconds, MAX(created_at) AS last_request_at "
+            "FROM usage_events GROUP BY uid ORDER BY output_tokens DESC LIMIT ?",
+            (limit,),
+        )
+        return [dict(row) for row in rows]
+
+    # Analytics
+    def analytics(self, days=14):
+        stats = empty_stats(days)
+        since = stats["since"]
+        conn = self._connect()
+        stats["total_users"] = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        stats["active_users"] = conn.execute(
+            "SELECT COUNT(DISTINCT uid) FROM usage_events WHERE created_at >= ?", (since,)
+        ).fetchone()[0]
+        row = conn.execute(
+            "SELECT COUNT(*) AS plans, AVG(duration) AS avg_duration FROM plans WHERE created_at >= ?", (since,)
+        ).fetchone()
+        stats["plans"], stats["avg_plan_duration"] = row["plans"], row["avg_duration"]
+        per_day = dict(conn.execute(
+            "SELECT substr(created_at, 1, 10) AS day, COUNT(*) FROM plans WHERE created_at >= ? GROUP BY day",
+            (since,),
+        ).fetchall())
+        for entry in stats["plans_per_day"]:
+            entry["plans"] = per_day.get(entry["day"], 0)
+        # Each turn keeps the sport it was asked under, as on Firestore; rows from before the
+        # sport column have none and are counted as "Unknown"
+        rows = conn.execute(
+            "SELECT sport, COUNT(*) AS chats FROM chats WHERE created_at >= ? GROUP BY sport", (since,)
+        ).fetchall()
+        stats["chats"] = sum(row["chats"] for row in rows)
+        stats["chats_by_sport"] = [dict(row) for row in rows if row["sport"]]
+        return finish_stats(stats)
@@ -0,0 +1,239 @@
+# utils/storage.py
+import os
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+import streamlit as st
+from datetime import datetime
+from firebase_admin import auth, firestore
+
+from utils import analytics, chat_store, plan_store
+from utils.db import get_db
+
+# Persistence for accounts, user profiles, plans and chats goes through a StorageBackend.
+# STORAGE_BACKEND selects the implementation: "firestore" (default) or "sqlite".
+BACKEND_FIRESTORE = "firestore"
+BACKEND_SQLITE = "sqlite"
+
+
+class AccountExistsError(Exception):
+    """Raised when registering an email that already has an account."""
+
+
+class AccountNotFoundError(Exception):
+    """Raised when no account matches an email, or the credentials are wrong."""
+
+
+class StorageBackend(ABC):
+    """Interface shared by all storage backends; a backend missing a method fails at construction."""
+
+    name = "base"
+
+    # Accounts
+    @abstractmethod
+    def create_account(self, email: str, password: str, display_name: str) -> str:
+        raise NotImplementedError
+
+    @abstractmethod
+    def authenticate(self, email: str, password: str) -> str:
+        raise NotImplementedError
+
+    # User profiles
+    @abstractmethod
+    def get_user(self, user_id: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_user(self, user_id: str, user_data: dict, merge: bool = True):
+        raise NotImplementedError
+
+    # Plans
+    @abstractmethod
+    def save_plan(self, user_id: str, plan_html: str, duration: int, focus: str) -> dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_plans(self, user_id: str, page_size: int = 20, start_after=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_plan_body(self, body_hash: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_plan_by_id(self, user_id: str, plan_id: str):
+        raise NotImplementedError
+
+    # Chats
+    @abstractmethod
+    def append_chat_turn(self, user_id: str, message: str, response: str, sport: str = None,
+                         plan_ref: str = None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_recent_turns(self, user_id: str, limit: int = 200):
+        raise NotImplementedError
+
+    # Usage accounting
+    @abstractmethod
+    def record_usage(self, user_id: str, kind: str, input_tokens: int, output_tokens: int, seconds: float):
+        raise NotImplementedError
+
+    @abstractmethod
+    def usage_window(self, user_id: str, since: str, kind: str) -> dict:
+        """{"requests": requests of `kind`, "tokens": input + output tokens of all kinds} at or after an ISO timestamp."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def oldest_usage_since(self, user_id: str, since: str, kind: str = None):
+        """created_at of the oldest usage event (of `kind`, if given) at or after an ISO timestamp, or None."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def top_usage(self, limit: int = 10):
+        """Per-user lifetime totals, heaviest token consumers first."""
+        raise NotImplementedError
+
+    # Analytics
+    @abstractmethod
+    def analytics(self, days: int = 14) -> dict:
+        """Operational aggregates over the last `days` days; see utils.analytics.empty_stats for the shape."""
+        raise NotImplementedError
+
+    @contextmanager
+    def batch(self):
+        """Group several writes into one transaction where the backend supports it."""
+        yield self
+
+
+class FirestoreStorage(StorageBackend):
+    """Storage on Cloud Firestore with Firebase Auth accounts."""
+
+    name = BACKEND_FIRESTORE
+
+    def __init__(self, db):
+        self.db = db
+
+    def create_account(self, email, password, display_name):
+        try:
+            user = auth.create_user(email=email, password=password, display_name=display_name)
+        except auth.EmailAlreadyExistsError as e:
+            raise AccountExistsError(email) from e
+        return user.uid
+
+    def authenticate(self, email, password):
+        # Note: Firebase Admin SDK doesn't have password verification
+        # For actual auth, you need Firebase Client SDK or REST API
+        try:
+            return auth.get_user_by_email(email).uid
+        except auth.UserNotFoundError as e:
+            raise AccountNotFoundError(email) from e
+
+    def get_user(self, user_id):
+        doc = self.db.collection("users").document(user_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def set_user(self, user_id, user_data, merge=True):
+        self.db.collection("users").document(user_id).set(user_data, merge=merge)
+
+    def save_plan(self, user_id, plan_html, duration, focus):
+        return plan_store.save_plan(self.db, user_id, plan_html, duration, focus)
+
+    def list_plans(self, user_id, page_size=20, start_after=None):
+        return plan_store.list_plans(self.db, user_id, page_size, start_after)
+
+    def load_plan_body(self, body_hash):
+        return plan_store.load_plan_body(self.db, body_hash)
+
+    def load_plan_by_id(self, user_id, plan_id):
+        return plan_store.load_plan_by_id(self.db, user_id, plan_id)
+
+    def append_chat_turn(self, user_id, message, response, sport=None, plan_ref=None):
+        chat_store.append_chat_turn(self.db, user_id, message, response, sport=sport, plan_ref=plan_ref)
+
+    def load_recent_turns(self, user_id, limit=200):
+        return chat_store.load_recent_turns(self.db, user_id, limit)
+
+    # Usage lives in usage/{uid} (running totals) and usage/{uid}/events (one document per request),
+    # separate from users/{uid} so profile saves never overwrite counters
+    def record_usage(self, user_id, kind, input_tokens, output_tokens, seconds):
+        now = datetime.now().isoformat()
+        usage_ref = self.db.collection("usage").document(user_id)
+        batch = self.db.batch()
+        batch.set(usage_ref.collection("events").document(), {
+            "kind": kind, "input_tokens": input_tokens, "output_tokens": output_tokens,
+            "seconds": seconds, "created_at": now,
+        })
+        batch.set(usage_ref, {
+            "uid": user_id,
+            "requests": firestore.Increment(1),
+            "input_tokens": firestore.Increment(input_tokens),
+            "output_tokens": firestore.Increment(output_tokens),
+            "seconds": firestore.Increment(seconds),
+            "last_request_at": now,
+        }, merge=True)
+        batch.commit()
+
+    # Per-kind counts (kind + created_at) and token sums (created_at + input/output_tokens) need the
+    # composite indexes in firestore.indexes.json (deploy with `firebase deploy --only firestore:indexes`)
+    def _usage_events(self, user_id, since, kind=None):
+        query = self.db.collection("usage").document(user_id).collection("events").where("created_at", ">=", since)
+        return query.where("kind", "==", kind) if kind else query
+
+    def usage_window(self, user_id, since, kind):
+        # Aggregations bill one read per 1,000 index entries instead of one per event
+        tokens = analytics.aggregate(
+            self._usage_events(user_id, since)
+            .sum("input_tokens", alias="input_tokens").sum("output_tokens", alias="output_tokens")
+        )
+        requests = analytics.aggregate(self._usage_events(user_id, since, kind).count(alias="requests"))
+        return {
+            "requests": int(requests.get("requests") or 0),
+            "tokens": int((tokens.get("input_tokens") or 0) + (tokens.get("output_tokens") or 0)),
+        }
+
+    def oldest_usage_since(self, user_id, since, kind=None):
+        query = self._usage_events(user_id, since, kind).order_by("created_at").limit(1).select(["created_at"])
+        return next((snap.get("created_at") for snap in query.stream()), None)
+
+    def top_usage(self, limit=10):
+        query = self.db.collection("usage").order_by("output_tokens", direction="DESCENDING").limit(limit)
+        return [{"uid": snap.id, **snap.to_dict()} for snap in query.stream()]
+
+    def analytics(self, days=14):
+        return analytics.firestore_stats(self.db, days)
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_backend_name() -> str:
+    return os.getenv("STORAGE_BACKEND", BACKEND_FIRESTORE).lower()
+
+
+def get_storage():
+    """
+    Returns the process-wide storage backend, or None if it could not be initialized.
+    """
+    global _storage
+    if _storage is not None:
+        return _storage
+    with _storage_lock:
+        if _storage is not None:
+            return _storage
+        backend = get_backend_name()
+        try:
+            if backend == BACKEND_SQLITE:
+                from utils.sqlite_store import SQLiteStorage
+                _storage = SQLiteStorage(os.getenv("SQLITE_DB_PATH", "minigpt_coach.db"))
+            elif backend == BACKEND_FIRESTORE:
+                db = get_db()
+                _storage = FirestoreStorage(db) if db is not None else None
+            else:
+                st.error(f"Unknown STORAGE_BACKEND '{backend}'. Use 'firestore' or 'sqlite'.")
+        except Exception as e:
+            st.error(f"Failed to initialize {backend} storage: {e}")
+            _storage = None
+    return _storage
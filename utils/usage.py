@@ -0,0 +1,95 @@
+# utils/usage.py
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from utils.profiling import stage
+
+# Sliding-window quotas per user. Each limit applies to the last QUOTA_WINDOW_SECONDS;
+# set a limit to 0 to disable it.
+QUOTA_WINDOW_SECONDS = int(os.getenv("QUOTA_WINDOW_SECONDS", "3600"))
+QUOTA_LIMITS = {
+    "plan": int(os.getenv("QUOTA_PLANS", "10")),
+    "chat": int(os.getenv("QUOTA_CHATS", "60")),
+    "diet": int(os.getenv("QUOTA_DIETS", "10")),
+}
+QUOTA_TOKENS = int(os.getenv("QUOTA_TOKENS", "300000"))
+
+_KIND_LABELS = {"plan": "training plans", "chat": "coach messages", "diet": "diet plans"}
+
+_current_meter = contextvars.ContextVar("usage_meter", default=None)
+
+
+class UsageMeter:
+    """Accumulates model token usage for one user request."""
+
+    def __init__(self):
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.model_calls = 0
+        self.seconds = 0.0
+
+
+def add_model_usage(response):
+    """Add a Gemini response's token counts to the request currently being tracked, if any."""
+    meter = _current_meter.get()
+    metadata = getattr(response, "usage_metadata", None)
+    if meter is None or metadata is None:
+        return
+    meter.model_calls += 1
+    meter.input_tokens += getattr(metadata, "prompt_token_count", 0) or 0
+    meter.output_tokens += getattr(metadata, "candidates_token_count", 0) or 0
+
+
+@contextmanager
+def track_usage(store, user_id, kind):
+    """Measure one user request (tokens and wall time) and record it in storage when it ends."""
+    meter = UsageMeter()
+    token = _current_meter.set(meter)
+    started = time.time()
+    try:
+        yield meter
+    finally:
+        _current_meter.reset(token)
+        meter.seconds = time.time() - started
+        if store is not None and user_id:
+            try:
+                store.record_usage(user_id, kind, meter.input_tokens, meter.output_tokens, meter.seconds)
+            except Exception as e:
+                print(f"Failed to record usage: {e}")
+
+
+def _format_wait(seconds):
+    minutes = max(1, round(seconds / 60))
+    return f"{minutes} minute{'s' if minutes != 1 else ''}"
+
+
+@stage("usage.check_quota")
+def check_quota(store, user_id, kind):
+    """Return a friendly throttling message if the user is over quota for this kind of request, else None."""
+    if store is None or not user_id:
+        return None
+    now = datetime.now()
+    since = (now - timedelta(seconds=QUOTA_WINDOW_SECONDS)).isoformat()
+    # Counts and token sums come from aggregates; individual events are never downloaded
+    usage = store.usage_window(user_id, since, kind)
+    window_label = _format_wait(QUOTA_WINDOW_SECONDS)
+
+    def retry_after(oldest_kind=None):
+        # The window frees up when the oldest counted event ages out
+        oldest = store.oldest_usage_since(user_id, since, oldest_kind)
+        if oldest is None:
+            return _format_wait(0)
+        return _format_wait((datetime.fromisoformat(oldest) + timedelta(seconds=QUOTA_WINDOW_SECONDS) - now).total_seconds())
+
+    limit = QUOTA_LIMITS.get(kind, 0)
+    if limit and usage["requests"] >= limit:
+        return (f"You've reached the limit of {limit} {_KIND_LABELS.get(kind, kind)} per {window_label}. "
+                f"Take a breather and try again in about {retry_after(kind)}.")
+
+    if QUOTA_TOKENS and usage["tokens"] >= QUOTA_TOKENS:
+        return (f"You've used your AI allowance for the last {window_label}. "
+                f"It refreshes gradually; try again in about {retry_after()}.")
+    return None